@@ -1,5 +1,10 @@
 from speakeasypy.src.speakeasy import Speakeasy
 from speakeasypy.src.chatroom import Chatroom
+from speakeasypy.src.async_speakeasy import AsyncSpeakeasy
+from speakeasypy.src.async_chatroom import AsyncChatroom
+from speakeasypy.src.events import MessageEvent, ReactionEvent
+from speakeasypy.src.scheduler import PollScheduler, RoomPoll
+from speakeasypy.src.checkpoint import CheckpointStore, RoomCheckpoint
 
 
 speakeasy = Speakeasy(
@@ -0,0 +1,71 @@
+import asyncio
+import logging
+import time
+
+from typing import AsyncIterator, List
+from speakeasypy.openapi.client.models import RestChatMessage, ChatMessageReaction
+from speakeasypy.src.chatroom import Chatroom
+from speakeasypy.src.events import Event, MessageEvent, ReactionEvent
+
+
+class AsyncChatroom(Chatroom):
+    def __init__(self, *args, **kwargs):
+        """AsyncChatroom - a Chatroom whose api methods are coroutines.
+
+        The blocking api calls run in the event loop's default executor and rate limits are
+        awaited with `asyncio.sleep`, so a single event loop can serve many rooms without
+        threads sleeping on rate limits. Takes the same arguments as Chatroom.
+        """
+        super().__init__(*args, **kwargs)
+        self._state_lock = asyncio.Lock()
+        self._post_lock = asyncio.Lock()
+
+    async def _update_chat_room_state(self):
+        """ Cache the state of this room, concurrent callers share a single api call. """
+        async with self._state_lock:
+            if not self._state_is_stale():
+                return
+
+            current_time = time.time()
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(None, self._fetch_state)
+                self._apply_state(response, current_time)
+            except Exception as e:
+                logging.error(f"An error occurred while updating the state of room {self.room_id}: {e}")
+
+    async def get_messages(self, only_partner=True, only_new=True) -> List[RestChatMessage]:
+        await self._update_chat_room_state()
+        return self._filter_messages(only_partner, only_new)
+
+    async def get_reactions(self, only_new=True) -> List[ChatMessageReaction]:
+        await self._update_chat_room_state()
+        return self._filter_reactions(only_new)
+
+    async def post_messages(self, message) -> bool:
+        if not self.session_token:
+            logging.error(f"This room {self.room_id} has no active session. Posting messages failed.")
+            return False
+
+        # posts of this room are sent one after the other, other rooms keep running while we wait
+        async with self._post_lock:
+            while not self._post_bucket.try_acquire():
+                await asyncio.sleep(self._post_bucket.wait_time())
+            return await asyncio.get_running_loop().run_in_executor(None, self._send, message)
+
+    async def poll_events(self, only_partner=True) -> List[Event]:
+        """ New messages and reactions of this room as events, messages first. """
+        messages = await self.get_messages(only_partner=only_partner, only_new=True)
+        reactions = await self.get_reactions(only_new=True)
+        return [MessageEvent(self, m) for m in messages] + [ReactionEvent(self, r) for r in reactions]
+
+    async def events(self, interval: float = 2, only_partner=True) -> AsyncIterator[Event]:
+        """ Poll this room every `interval` seconds and yield its new messages and reactions.
+
+        An event is marked as processed once the consumer asks for the next one, so an event
+        whose handling raises is delivered again by the next stream.
+        """
+        while True:
+            for event in await self.poll_events(only_partner):
+                yield event
+                self.mark_as_processed(event.item)
+            await asyncio.sleep(interval)
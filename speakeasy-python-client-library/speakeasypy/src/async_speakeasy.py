@@ -0,0 +1,74 @@
+from speakeasypy.src.async_chatroom import AsyncChatroom
+from speakeasypy.src.events import Event, MessageEvent
+from speakeasypy.src.speakeasy import Speakeasy
+from typing import AsyncIterator, List
+
+import asyncio
+import inspect
+import logging
+import time
+
+
+class AsyncSpeakeasy(Speakeasy):
+    """Speakeasy with awaitable room listing and an `async for` event stream over all rooms.
+
+    `login` and `logout` stay blocking, they are called once per session. The rooms are
+    AsyncChatroom instances sharing the OpenAPI models with the blocking client.
+    """
+
+    _chatroom_class = AsyncChatroom
+
+    def __init__(self, host: str, username: str, password: str, **kwargs):
+        super().__init__(host=host, username=username, password=password, **kwargs)
+        self._rooms_lock = asyncio.Lock()
+
+    async def _update_chat_rooms(self):
+        async with self._rooms_lock:
+            if not self._rooms_are_stale():
+                return
+
+            current_time = time.time()
+            try:
+                response = await asyncio.get_running_loop().run_in_executor(None, self._fetch_rooms)
+                self._apply_rooms(response, current_time)
+            except Exception as e:
+                logging.error(f"An error occurred while fetching chat rooms: {e}")
+
+    async def get_rooms(self, active=True) -> List[AsyncChatroom]:
+        await self._update_chat_rooms()
+        return self._select_rooms(active)
+
+    async def events(self, interval: float = 2, only_partner=True) -> AsyncIterator[Event]:
+        """Poll all active rooms concurrently every `interval` seconds and yield their new
+        messages and reactions.
+
+        An event is marked as processed once the consumer asks for the next one, so an event
+        whose handling raises is delivered again by the next stream.
+        """
+        while True:
+            rooms = await self.get_rooms(active=True)
+            polled = await asyncio.gather(*(room.poll_events(only_partner) for room in rooms))
+            for events in polled:
+                for event in events:
+                    yield event
+                    event.room.mark_as_processed(event.item)
+            await asyncio.sleep(interval)
+
+    async def run(self, **kwargs):
+        """Pass the `events` (with the same arguments) to the registered callbacks, until cancelled.
+
+        Callbacks may be plain functions or coroutine functions, the latter are awaited. An event is
+        marked as processed after its callbacks returned, also when one of them raised.
+        """
+        async for event in self.events(**kwargs):
+            if isinstance(event, MessageEvent):
+                callbacks = self._message_callbacks
+            else:
+                callbacks = self._reaction_callbacks
+            for callback in callbacks:
+                try:
+                    result = callback(event)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as e:
+                    logging.error(f"An error occurred while handling {event.key} in room {event.room.room_id}: {e}")
@@ -1,9 +1,14 @@
+import itertools
 import logging
+import threading
 import time
 
+from concurrent.futures import Future
 from datetime import datetime
-from typing import List, Union
+from typing import Dict, List, Tuple, Union
 from speakeasypy.openapi.client.models import RestChatMessage, ChatMessageReaction
+from speakeasypy.src.checkpoint import CheckpointStore, RoomCheckpoint
+from speakeasypy.src.rate_limiter import MessageSender, TokenBucket
 
 
 class Chatroom:
@@ -23,8 +28,20 @@ class Chatroom:
             my_alias (str): The alias of this bot for the chatroom.
             prompt (str): The prompt associated with the chatroom.
             start_time (int): The starting time of the chatroom.
-            remaining_time (int): The remaining time for the chatroom's activity.
+            remaining_time (int): The remaining time for the chatroom's activity in milliseconds, counted down locally.
             user_aliases (List[str]): A list of user aliases participating in the chatroom (generally including a chat partner and your bot).
+
+        Keyword Args:
+            sender (MessageSender): Background sender shared by the rooms of a Speakeasy session,
+                a room without one starts its own.
+            post_burst (int): Posts that may be sent back to back before the request limit applies.
+            coalesce_window (float): Seconds a posted message is held back so that messages posted
+                meanwhile are sent with it as one post, 0 (the default) posts every message on its own.
+            max_message_length (int): Longest combined post when coalescing, None for no limit.
+            history_size (int): Messages kept in the cache, older processed messages are dropped.
+                Unprocessed messages are always kept. None keeps the whole history, defaults to 100.
+            checkpoint_store (CheckpointStore): Durable store the processed state and `initiated` are written to.
+            checkpoint (RoomCheckpoint): Processed state of this room to resume from, e.g. after a restart.
         """
 
         self.room_id = room_id
@@ -33,7 +50,8 @@ class Chatroom:
         self.start_time = start_time
         self.remaining_time = remaining_time
         self.user_aliases = user_aliases
-        self.initiated = False  # This flag indicates whether a welcome message has been sent
+        self._checkpoint_store: CheckpointStore = kwargs.get('checkpoint_store', None)
+        self.__initiated = False  # This flag indicates whether a welcome message has been sent
 
         logging.basicConfig(level=logging.INFO)
 
@@ -44,104 +62,217 @@ class Chatroom:
                           f"api requests by this chatroom will result in an error")
         # Store ordinals for processed messages and reactions to exclude them from "new" messages.
         self.processed_ordinals = {
-            'messages': [],
-            'reactions': [],
+            'messages': set(),
+            'reactions': set(),
         }
+        # Reactions are keyed by (message_ordinal, type), so several reactions to one message are
+        # told apart. Every message ordinal below the watermark is processed, processed_ordinals['messages']
+        # only holds the processed ordinals above it. Messages sent by this bot count as processed.
+        self.processed_watermark = 0
+
+        checkpoint: RoomCheckpoint = kwargs.get('checkpoint', None)
+        if checkpoint is not None:
+            self.__initiated = checkpoint.initiated
+            self.processed_watermark = checkpoint.watermark
+            self.processed_ordinals['messages'] = set(checkpoint.messages)
+            self.processed_ordinals['reactions'] = set(checkpoint.reactions)
 
         self.__request_limit = kwargs.get('request_limit', 1)  # seconds
         self.__state_api_cache = None  # ChatRoomState (including messages and reactions from api call)
+        self.__messages: Dict[int, RestChatMessage] = {}  # cached messages by ordinal, in arrival order
+        self.__history_size = kwargs.get('history_size', 100)
+        # guards the cached state, messages may be marked as processed from other threads than the poller
+        self.__lock = threading.RLock()
+        # reactions seen but not yet processed, by (message_ordinal, type), in arrival order
+        self.__new_reactions: Dict[Tuple[int, str], ChatMessageReaction] = {}
         self.__last_msg_timestamp = 0
         self.__last_state_call = 0
-        self.__last_post_call = 0
+        # outgoing messages are queued and posted by a background sender at the pace of this bucket
+        self._post_bucket = TokenBucket(self.__request_limit, kwargs.get('post_burst', 1))
+        self._sender = kwargs.get('sender') or MessageSender()
+        self.coalesce_window = kwargs.get('coalesce_window', 0)
+        self.max_message_length = kwargs.get('max_message_length', None)
 
-    def __update_chat_room_state(self):
-        """ Cache the state of this room and implement a request rate limit for this API call. """
+    @property
+    def initiated(self) -> bool:
+        """ Whether a welcome message has been sent, stored in the checkpoint store if there is one. """
+        return self.__initiated
+
+    @initiated.setter
+    def initiated(self, initiated: bool):
+        if self._checkpoint_store is not None and initiated != self.__initiated:
+            self._checkpoint_store.save_initiated(self.room_id, initiated)
+        self.__initiated = initiated
+
+    @property
+    def remaining_time(self) -> int:
+        """ Remaining time in milliseconds, counted down locally since it was last set from the server. """
+        elapsed_ms = int((time.monotonic() - self.__remaining_time_set_at) * 1000)
+        return max(0, self.__remaining_time - elapsed_ms)
+
+    @remaining_time.setter
+    def remaining_time(self, remaining_time: int):
+        self.__remaining_time = remaining_time
+        self.__remaining_time_set_at = time.monotonic()
+
+    def _state_is_stale(self) -> bool:
+        """ Whether the cached room state may be refreshed under the request rate limit. """
         if not self.session_token:
             logging.error(f"This room {self.room_id} has no active session. Updating room state failed.")
-            return
-        current_time = time.time()
-        elapsed_time = current_time - self.__last_state_call
-        if elapsed_time < self.__request_limit and self.__state_api_cache is not None:
-            return
+            return False
+        elapsed_time = time.time() - self.__last_state_call
+        return elapsed_time >= self.__request_limit or self.__state_api_cache is None
 
-        try:
-            response = self.chat_api.get_api_room_with_roomid_with_since(
-                room_id=self.room_id, since=self.__last_msg_timestamp, session=self.session_token)
+    def _fetch_state(self):
+        """ Blocking api call for the messages since the last cached one and all reactions. """
+        return self.chat_api.get_api_room_with_roomid_with_since(
+            room_id=self.room_id, since=self.__last_msg_timestamp, session=self.session_token)
+
+    def _apply_state(self, response, call_time: float):
+        """ Merge an api response into the cached room state. """
+        with self.__lock:
             if response:
                 if self.__state_api_cache is None:
                     self.__state_api_cache = response
+                    self.__diff_reactions(response.reactions)
+                    if response.messages:
+                        # the first response starts at the oldest message of the room
+                        oldest = min(m.ordinal for m in response.messages)
+                        self.processed_watermark = max(self.processed_watermark, oldest)
                 else:
                     # The reactions returned by the backend have nothing to do with the "since" parameter for now,
-                    # so just copy all reactions here.
+                    # so keep the latest list and only pick up the reactions not seen before.
                     self.__state_api_cache.reactions = response.reactions
-                    # Append new messages and update the last timestamp
-                    for m in response.messages:
-                        if m.ordinal not in [msg.ordinal for msg in self.__state_api_cache.messages]:
-                            self.__state_api_cache.messages.append(m)
-                            self.__last_msg_timestamp = max(self.__last_msg_timestamp, m.time_stamp)
+                    self.__diff_reactions(response.reactions)
+                # Append new messages and update the last timestamp, processed messages that were
+                # dropped from the history are not added again
+                for m in response.messages:
+                    self.__last_msg_timestamp = max(self.__last_msg_timestamp, m.time_stamp)
+                    if m.ordinal not in self.__messages and not self._is_processed_ordinal(m.ordinal):
+                        self.__messages[m.ordinal] = m
+                        if m.author_alias == self.my_alias:
+                            # messages of this bot need no processing
+                            self.processed_ordinals['messages'].add(m.ordinal)
+                self.__state_api_cache.messages = []  # messages are kept in __messages
+                self.__compact()
             else:
                 logging.error(f"Failed to update the state of room {self.room_id}.")
-            self.__last_state_call = current_time
+            self.__last_state_call = call_time
+
+    def __diff_reactions(self, reactions: List[ChatMessageReaction]):
+        processed = self.processed_ordinals['reactions']
+        for reaction in reactions:
+            key = (reaction.message_ordinal, reaction.type)
+            if key not in processed and key not in self.__new_reactions:
+                self.__new_reactions[key] = reaction
+
+    def _is_processed_ordinal(self, ordinal: int) -> bool:
+        return ordinal < self.processed_watermark or ordinal in self.processed_ordinals['messages']
+
+    def __compact(self):
+        """ Advance the watermark over processed messages and drop processed messages beyond the
+        history size, so the state of a long-lived room stays bounded. """
+        processed = self.processed_ordinals['messages']
+        while self.processed_watermark in processed:
+            processed.discard(self.processed_watermark)
+            self.processed_watermark += 1
+
+        if self.__history_size is None:
+            return
+        excess = len(self.__messages) - self.__history_size
+        if excess > 0:
+            for ordinal in list(itertools.islice(self.__messages, excess)):
+                if self._is_processed_ordinal(ordinal):
+                    del self.__messages[ordinal]
+
+    def __update_chat_room_state(self):
+        """ Cache the state of this room and implement a request rate limit for this API call. """
+        if not self._state_is_stale():
+            return
+
+        current_time = time.time()
+        try:
+            self._apply_state(self._fetch_state(), current_time)
         except Exception as e:
             logging.error(f"An error occurred while updating the state of room {self.room_id}: {e}")
 
-    def get_messages(self, only_partner=True, only_new=True) -> List[RestChatMessage]:
-        self.__update_chat_room_state()
-        if self.__state_api_cache is None:
-            logging.error(f"Updating room state failed. No messages in room {self.room_id}.")
-            return []
+    def _filter_messages(self, only_partner: bool, only_new: bool) -> List[RestChatMessage]:
+        with self.__lock:
+            if self.__state_api_cache is None:
+                logging.error(f"Updating room state failed. No messages in room {self.room_id}.")
+                return []
 
-        filtered_messages = self.__state_api_cache.messages
+            filtered_messages = list(self.__messages.values())
 
-        if only_partner:  # TODO: openAPI will automatically converts 'authorAlias' to 'author_alias'
-            filtered_messages = [message for message in filtered_messages if message.author_alias != self.my_alias]
+            if only_partner:  # TODO: openAPI will automatically converts 'authorAlias' to 'author_alias'
+                filtered_messages = [message for message in filtered_messages if message.author_alias != self.my_alias]
 
-        if only_new:
-            filtered_messages = [message for message in filtered_messages if
-                                 message.ordinal not in self.processed_ordinals['messages']]
+            if only_new:
+                filtered_messages = [message for message in filtered_messages if
+                                     not self._is_processed_ordinal(message.ordinal)]
 
-        return filtered_messages
+            return filtered_messages
+
+    def _filter_reactions(self, only_new: bool) -> List[ChatMessageReaction]:
+        with self.__lock:
+            if self.__state_api_cache is None:
+                logging.error(f"Updating room state failed. No reactions in room {self.room_id}.")
+                return []
+
+            if only_new:
+                return list(self.__new_reactions.values())
+            return list(self.__state_api_cache.reactions)
+
+    def get_messages(self, only_partner=True, only_new=True) -> List[RestChatMessage]:
+        self.__update_chat_room_state()
+        return self._filter_messages(only_partner, only_new)
 
     def get_reactions(self, only_new=True) -> List[ChatMessageReaction]:
         self.__update_chat_room_state()
-        if self.__state_api_cache is None:
-            logging.error(f"Updating room state failed. No reactions in room {self.room_id}.")
-            return []
-
-        filtered_reactions = self.__state_api_cache.reactions
-        if only_new:
-            filtered_reactions = [reaction for reaction in filtered_reactions if
-                                  reaction.message_ordinal not in self.processed_ordinals['reactions']]
-        return filtered_reactions
-
-    def post_messages(self, message):
-        if self.session_token:
-            # Check if the time elapsed since the last post call is less than the request limit.
-            current_time = time.time()
-            elapsed_time = current_time - self.__last_post_call
-            # If elapsed time is less than the request limit, sleep for the remaining time to enforce rate limiting.
-            if elapsed_time < self.__request_limit:
-                time.sleep(self.__request_limit - elapsed_time)
-                print(f"(Sleep {self.__request_limit - elapsed_time} secs to avoid posting requests too frequently.)")
-            try:
-                response = self.chat_api.post_api_room_with_roomid(
-                    room_id=self.room_id, session=self.session_token, body=message)
-                if not response:
-                    logging.error(f"Failed to post message to room {self.room_id}.")
-            except Exception as e:
-                logging.error(f"An error occurred while posting the message to room {self.room_id}:", e)
-
-            self.__last_post_call = time.time()  # store the completed time
-        else:
+        return self._filter_reactions(only_new)
+
+    def _send(self, message) -> bool:
+        """ Blocking api call posting one message. """
+        try:
+            response = self.chat_api.post_api_room_with_roomid(
+                room_id=self.room_id, session=self.session_token, body=message)
+            if response:
+                return True
+            logging.error(f"Failed to post message to room {self.room_id}.")
+        except Exception as e:
+            logging.error(f"An error occurred while posting the message to room {self.room_id}: {e}")
+        return False
+
+    def post_messages(self, message) -> Future:
+        """ Queue a message for posting and return without waiting for the rate limit.
+
+        Messages of a room are posted in order. The returned future resolves to whether the post succeeded,
+        messages coalesced into one post share the future.
+        """
+        if not self.session_token:
             logging.error(f"This room {self.room_id} has no active session. Posting messages failed.")
+            future = Future()
+            future.set_result(False)
+            return future
+        return self._sender.submit(self, message)
 
     def mark_as_processed(self, msg_or_rec: Union[RestChatMessage, ChatMessageReaction]):
-        if isinstance(msg_or_rec, RestChatMessage):
-            self.processed_ordinals['messages'].append(msg_or_rec.ordinal)
-        elif isinstance(msg_or_rec, ChatMessageReaction):
-            self.processed_ordinals['reactions'].append(msg_or_rec.message_ordinal)
-        else:
-            logging.error("Please pass a message or reaction object to mark it as processed.")
+        with self.__lock:
+            if isinstance(msg_or_rec, RestChatMessage):
+                if msg_or_rec.ordinal >= self.processed_watermark:
+                    self.processed_ordinals['messages'].add(msg_or_rec.ordinal)
+                    self.__compact()
+                    if self._checkpoint_store is not None:
+                        self._checkpoint_store.save_messages(
+                            self.room_id, self.processed_watermark, self.processed_ordinals['messages'])
+            elif isinstance(msg_or_rec, ChatMessageReaction):
+                key = (msg_or_rec.message_ordinal, msg_or_rec.type)
+                self.processed_ordinals['reactions'].add(key)
+                self.__new_reactions.pop(key, None)
+                if self._checkpoint_store is not None:
+                    self._checkpoint_store.save_reaction(self.room_id, *key)
+            else:
+                logging.error("Please pass a message or reaction object to mark it as processed.")
 
     def get_chat_partner(self) -> str:
         # get the alias of your chat partner
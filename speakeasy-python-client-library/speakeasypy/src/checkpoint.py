@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+
+from typing import Dict, Iterable, NamedTuple, Set, Tuple
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rooms (
+    room_id TEXT PRIMARY KEY,
+    watermark INTEGER NOT NULL DEFAULT 0,
+    initiated INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS messages (
+    room_id TEXT NOT NULL,
+    ordinal INTEGER NOT NULL,
+    PRIMARY KEY (room_id, ordinal)
+);
+CREATE TABLE IF NOT EXISTS reactions (
+    room_id TEXT NOT NULL,
+    message_ordinal INTEGER NOT NULL,
+    type TEXT NOT NULL,
+    PRIMARY KEY (room_id, message_ordinal, type)
+);
+"""
+
+
+class RoomCheckpoint(NamedTuple):
+    """The processed state of one room as stored in a CheckpointStore."""
+    watermark: int
+    initiated: bool
+    messages: Set[int]  # processed message ordinals at or above the watermark
+    reactions: Set[Tuple[int, str]]  # processed (message_ordinal, type) keys
+
+
+class CheckpointStore:
+    def __init__(self, path: str):
+        """CheckpointStore - durable per-room processed state in a SQLite database.
+
+        Every change is committed right away, so a restarted bot neither welcomes a room again nor
+        answers messages it already processed. Safe to use from several threads.
+
+        Args:
+            path (str): The database file, created if it does not exist.
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.executescript(_SCHEMA)
+
+    def load(self) -> Dict[str, RoomCheckpoint]:
+        """ The checkpoints of all rooms by room_id. """
+        with self._lock:
+            rooms = self._conn.execute("SELECT room_id, watermark, initiated FROM rooms").fetchall()
+            messages = self._conn.execute("SELECT room_id, ordinal FROM messages").fetchall()
+            reactions = self._conn.execute("SELECT room_id, message_ordinal, type FROM reactions").fetchall()
+
+        checkpoints = {room_id: RoomCheckpoint(watermark, bool(initiated), set(), set())
+                       for room_id, watermark, initiated in rooms}
+        for room_id, ordinal in messages:
+            if room_id in checkpoints:
+                checkpoints[room_id].messages.add(ordinal)
+        for room_id, message_ordinal, reaction_type in reactions:
+            if room_id in checkpoints:
+                checkpoints[room_id].reactions.add((message_ordinal, reaction_type))
+        return checkpoints
+
+    def _ensure_room(self, room_id: str):
+        self._conn.execute("INSERT OR IGNORE INTO rooms (room_id) VALUES (?)", (room_id,))
+
+    def save_initiated(self, room_id: str, initiated: bool):
+        with self._lock, self._conn:
+            self._ensure_room(room_id)
+            self._conn.execute("UPDATE rooms SET initiated = ? WHERE room_id = ?", (int(initiated), room_id))
+
+    def save_messages(self, room_id: str, watermark: int, ordinals: Iterable[int]):
+        """ Store the watermark and the processed ordinals above it, replacing the previous ones. """
+        with self._lock, self._conn:
+            self._ensure_room(room_id)
+            self._conn.execute("UPDATE rooms SET watermark = ? WHERE room_id = ?", (watermark, room_id))
+            self._conn.execute("DELETE FROM messages WHERE room_id = ?", (room_id,))
+            self._conn.executemany("INSERT INTO messages (room_id, ordinal) VALUES (?, ?)",
+                                   [(room_id, ordinal) for ordinal in ordinals])
+
+    def save_reaction(self, room_id: str, message_ordinal: int, reaction_type: str):
+        with self._lock, self._conn:
+            self._ensure_room(room_id)
+            self._conn.execute("INSERT OR IGNORE INTO reactions (room_id, message_ordinal, type) VALUES (?, ?, ?)",
+                               (room_id, message_ordinal, reaction_type))
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,39 @@
+from typing import NamedTuple, Tuple, Union
+
+from speakeasypy.openapi.client.models import RestChatMessage, ChatMessageReaction
+from speakeasypy.src.chatroom import Chatroom
+
+
+class MessageEvent(NamedTuple):
+    """A new message of a chat partner in `room`."""
+    room: Chatroom
+    message: RestChatMessage
+
+    @property
+    def item(self) -> RestChatMessage:
+        """The object to pass to `Chatroom.mark_as_processed`."""
+        return self.message
+
+    @property
+    def key(self) -> Tuple:
+        """Identifies the event within its room."""
+        return 'message', self.message.ordinal
+
+
+class ReactionEvent(NamedTuple):
+    """A new reaction to one of the messages in `room`."""
+    room: Chatroom
+    reaction: ChatMessageReaction
+
+    @property
+    def item(self) -> ChatMessageReaction:
+        """The object to pass to `Chatroom.mark_as_processed`."""
+        return self.reaction
+
+    @property
+    def key(self) -> Tuple:
+        """Identifies the event within its room."""
+        return 'reaction', self.reaction.message_ordinal, self.reaction.type
+
+
+Event = Union[MessageEvent, ReactionEvent]
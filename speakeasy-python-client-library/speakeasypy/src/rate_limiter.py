@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from typing import TYPE_CHECKING, Deque, Dict, Optional
+
+if TYPE_CHECKING:
+    from speakeasypy.src.chatroom import Chatroom
+
+
+class TokenBucket:
+    def __init__(self, interval: float, capacity: int = 1):
+        """TokenBucket - a thread-safe token bucket rate limiter.
+
+        Args:
+            interval (float): Seconds to refill one token, 0 disables the limit.
+            capacity (int): Tokens that can be saved up, i.e. the largest burst of requests.
+        """
+        self.interval = interval
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.interval > 0:
+            self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) / self.interval)
+        else:
+            self._tokens = float(self.capacity)
+        self._last_refill = now
+
+    def wait_time(self) -> float:
+        """ Seconds until a token is available, 0 if one is available now. """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                return 0.0
+            return (1 - self._tokens) * self.interval
+
+    def try_acquire(self) -> bool:
+        """ Take a token if one is available. """
+        with self._lock:
+            self._refill()
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return True
+            return False
+
+
+class _Outgoing:
+    """ A queued post, possibly several coalesced messages sharing one future. """
+    __slots__ = ('room', 'message', 'future', 'ready_at')
+
+    def __init__(self, room: "Chatroom", message: str, ready_at: float):
+        self.room = room
+        self.message = message
+        self.future = Future()
+        self.ready_at = ready_at
+
+
+class MessageSender:
+    def __init__(self):
+        """MessageSender - posts queued messages of many rooms from one background thread.
+
+        Every room has its own FIFO queue and is paced by its own token bucket, so a room
+        waiting for its rate limit never holds back the messages of other rooms, and callers
+        never sleep. The thread is started on the first message.
+
+        Rooms with a `coalesce_window` > 0 hold a new message back for that many seconds, and
+        messages submitted while an earlier one is still queued are joined into one post as
+        long as it stays within the room's `max_message_length`.
+        """
+        self._cond = threading.Condition()
+        # room_id -> queued posts, in round-robin order
+        self._queues: Dict[str, Deque[_Outgoing]] = OrderedDict()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+    def submit(self, room: "Chatroom", message: str) -> Future:
+        """ Queue a message for `room`. The future resolves to whether the post succeeded. """
+        with self._cond:
+            if self._closed:
+                logging.error(f"The message sender is closed. Posting messages to room {room.room_id} failed.")
+                future = Future()
+                future.set_result(False)
+                return future
+
+            queue = self._queues.setdefault(room.room_id, deque())
+            if (room.coalesce_window > 0 and queue and not queue[-1].future.cancelled()
+                    and self._fits(room, queue[-1].message, message)):
+                queue[-1].message = f"{queue[-1].message}\n{message}"
+                return queue[-1].future
+
+            outgoing = _Outgoing(room, message, time.monotonic() + room.coalesce_window)
+            queue.append(outgoing)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="speakeasy-sender", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return outgoing.future
+
+    @staticmethod
+    def _fits(room: "Chatroom", queued: str, message: str) -> bool:
+        return room.max_message_length is None or len(queued) + 1 + len(message) <= room.max_message_length
+
+    def pending(self) -> int:
+        """ Number of queued posts not yet sent. """
+        with self._cond:
+            return sum(len(queue) for queue in self._queues.values())
+
+    def _next(self) -> Optional[_Outgoing]:
+        """ Block until some room may send its next post, None once closed and drained. """
+        with self._cond:
+            while True:
+                if not self._queues:
+                    if self._closed:
+                        return None
+                    self._cond.wait()
+                    continue
+
+                timeout = None
+                now = time.monotonic()
+                for room_id, queue in self._queues.items():
+                    outgoing = queue[0]
+                    # a closing sender flushes without waiting for more messages to coalesce
+                    wait = 0.0 if self._closed else outgoing.ready_at - now
+                    if wait <= 0:
+                        if outgoing.room._post_bucket.try_acquire():
+                            queue.popleft()
+                            # move the room behind the others so busy rooms take turns
+                            del self._queues[room_id]
+                            if queue:
+                                self._queues[room_id] = queue
+                            return outgoing
+                        wait = outgoing.room._post_bucket.wait_time()
+                    timeout = wait if timeout is None else min(timeout, wait)
+                self._cond.wait(timeout)
+
+    def _run(self):
+        while True:
+            outgoing = self._next()
+            if outgoing is None:
+                return
+            if outgoing.future.set_running_or_notify_cancel():
+                outgoing.future.set_result(outgoing.room._send(outgoing.message))
+
+    def close(self, timeout: Optional[float] = None):
+        """ Stop accepting messages and wait up to `timeout` seconds for the queued ones to be posted. """
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+            if thread.is_alive():
+                logging.error(f"{self.pending()} queued messages were not posted before closing.")
@@ -0,0 +1,110 @@
+import time
+
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional
+from speakeasypy.openapi.client.models import RestChatMessage, ChatMessageReaction
+from speakeasypy.src.chatroom import Chatroom
+
+if TYPE_CHECKING:
+    from speakeasypy.src.speakeasy import Speakeasy
+
+
+class RoomPoll(NamedTuple):
+    """New messages and reactions of one polled room."""
+    room: Chatroom
+    messages: List[RestChatMessage]
+    reactions: List[ChatMessageReaction]
+
+
+class _RoomSchedule:
+    __slots__ = ('interval', 'due')
+
+    def __init__(self, interval: float, due: float):
+        self.interval = interval
+        self.due = due
+
+
+class PollScheduler:
+    def __init__(self,
+                 speakeasy: "Speakeasy",
+                 min_interval: float = 1,
+                 max_interval: float = 30,
+                 backoff: float = 2,
+                 rooms_interval: float = 5,
+                 only_partner: bool = True,
+                 ):
+        """PollScheduler - polls each active room at its own, adaptive pace.
+
+        A room with new messages or reactions is polled again after `min_interval` seconds, every idle poll
+        multiplies its interval by `backoff` up to `max_interval`. Rooms whose remaining_time reached zero are
+        dropped, newly discovered rooms are polled right away.
+
+        Args:
+            speakeasy (Speakeasy): The logged in session whose rooms are polled.
+            min_interval (float): Seconds between polls of a busy room.
+            max_interval (float): Longest pause between polls of an idle room.
+            backoff (float): Factor the pause of an idle room grows by per idle poll.
+            rooms_interval (float): Longest pause between checks of the room list for opened and closed rooms.
+            only_partner (bool): If True, messages sent by the current bot are not reported.
+        """
+        self.speakeasy = speakeasy
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = backoff
+        self.rooms_interval = rooms_interval
+        self.only_partner = only_partner
+        self._schedules: Dict[str, _RoomSchedule] = {}
+
+    def _sync_rooms(self) -> Dict[str, Chatroom]:
+        now = time.monotonic()
+        rooms = {room.room_id: room for room in self.speakeasy.get_rooms(active=True) if room.remaining_time > 0}
+        for room_id in list(self._schedules):
+            if room_id not in rooms:
+                del self._schedules[room_id]
+        for room_id in rooms:
+            if room_id not in self._schedules:
+                self._schedules[room_id] = _RoomSchedule(self.min_interval, now)
+        return rooms
+
+    def next_due(self) -> Optional[float]:
+        """ Seconds until the next room is due, None without scheduled rooms. """
+        if not self._schedules:
+            return None
+        return max(0.0, min(s.due for s in self._schedules.values()) - time.monotonic())
+
+    def record(self, room: Chatroom, active: bool):
+        """ Reschedule `room` after a poll, quickly if it was `active` and with backoff otherwise. """
+        schedule = self._schedules.get(room.room_id)
+        if schedule is None:
+            return
+        if active:
+            schedule.interval = self.min_interval
+        else:
+            schedule.interval = min(self.max_interval, schedule.interval * self.backoff)
+        schedule.due = time.monotonic() + schedule.interval
+
+    def poll_due(self) -> List[RoomPoll]:
+        """ Poll every room that is due now, without waiting. """
+        rooms = self._sync_rooms()
+        now = time.monotonic()
+        polls = []
+        for room_id, schedule in list(self._schedules.items()):
+            if schedule.due > now:
+                continue
+            room = rooms[room_id]
+            messages = room.get_messages(only_partner=self.only_partner, only_new=True)
+            reactions = room.get_reactions(only_new=True)
+            self.record(room, bool(messages or reactions))
+            polls.append(RoomPoll(room, messages, reactions))
+        return polls
+
+    def poll(self) -> List[RoomPoll]:
+        """ Sleep until some room is due and poll the due rooms.
+
+        Returns the polled rooms, including the ones without new messages or reactions.
+        """
+        while True:
+            polls = self.poll_due()
+            if polls:
+                return polls
+            wait = self.next_due()
+            time.sleep(self.rooms_interval if wait is None else min(wait, self.rooms_interval))
@@ -4,20 +4,39 @@ from speakeasypy.openapi.client.apis import ChatApi
 from speakeasypy.openapi.client.api_client import ApiClient
 from speakeasypy.openapi.client.models import LoginRequest
 from speakeasypy.src.chatroom import Chatroom
-from typing import Dict, List
+from speakeasypy.src.checkpoint import CheckpointStore, RoomCheckpoint
+from speakeasypy.src.events import Event, MessageEvent, ReactionEvent
+from speakeasypy.src.rate_limiter import MessageSender
+from speakeasypy.src.scheduler import PollScheduler
+from typing import Callable, Dict, Iterator, List, Optional, Set, Tuple
 
 import logging
 import atexit
+import threading
 import time
 
 
 class Speakeasy:
+    _chatroom_class = Chatroom  # type of the rooms created from api responses
+
     def __init__(
         self,
         host: str,  # production: host = https://speakeasy.ifi.uzh.ch
         username: str,
         password: str,
+        coalesce_window: float = 0,
+        max_message_length: Optional[int] = None,
+        history_size: Optional[int] = 100,
+        rooms_refresh_interval: float = 10,
+        request_limit: float = 1,
+        checkpoint_path: Optional[str] = None,
     ):
+        """`coalesce_window`, `max_message_length`, `history_size` and `request_limit` are passed on to every
+        Chatroom. With a window > 0 messages posted shortly after each other are sent as one combined post,
+        each room keeps at most `history_size` processed messages and calls its apis at most once per
+        `request_limit` seconds. The list of rooms is fetched at most once per `rooms_refresh_interval` seconds,
+        see also `start_room_refresher`. With a `checkpoint_path` the processed messages and reactions and the
+        `initiated` flag of every room are stored in that SQLite file and restored on `login`."""
         self.config = Configuration(host=host, username=username, password=password)
         # Create an instance of the API client
         self.api_client = ApiClient(configuration=self.config)
@@ -27,15 +46,37 @@ class Speakeasy:
         self.chat_api = ChatApi(self.api_client)
 
         self.session_token = None
+        self.coalesce_window = coalesce_window
+        self.max_message_length = max_message_length
+        self.history_size = history_size
+        self.rooms_refresh_interval = rooms_refresh_interval
         self._chatrooms_dict: Dict[
             str, Chatroom
         ] = {}  # map room_id to Chatroom (cache)
         self.__last_call_for_rooms = 0
+        self.__request_limit = request_limit  # seconds, per room
+
+        self.checkpoint = CheckpointStore(checkpoint_path) if checkpoint_path else None
+        self._checkpoints: Dict[str, RoomCheckpoint] = {}  # restored on login
+
+        # room discovery: rooms reported as opened and not yet as closed, callbacks and background refresher
+        self._open_room_ids = set()
+        self._room_opened_callbacks: List[Callable[[Chatroom], None]] = []
+        self._room_closed_callbacks: List[Callable[[Chatroom], None]] = []
+        self._rooms_guard = threading.RLock()
+        self._refresher: Optional[threading.Thread] = None
+        self._refresher_stop = threading.Event()
 
-        self.__request_limit = 100000  # TODO: change the default value here!
+        self._message_callbacks: List[Callable[[MessageEvent], None]] = []
+        self._reaction_callbacks: List[Callable[[ReactionEvent], None]] = []
+
+        # posts messages of all rooms in the background, each room at its own rate limit
+        self.sender = MessageSender()
 
         logging.basicConfig(level=logging.INFO)
         atexit.register(self.logout)
+        # registered after logout so it runs first: queued messages are posted while the session is valid
+        atexit.register(self.sender.close, 10)
 
     def login(self) -> str:
         # Prepare the login request
@@ -50,6 +91,9 @@ class Speakeasy:
                 # store the session token
                 self.session_token = user_session_details.session_token
                 print("Login successful. Session token:", self.session_token)
+                if self.checkpoint is not None:
+                    # resume where the previous run stopped instead of answering everything again
+                    self._checkpoints = self.checkpoint.load()
             else:
                 logging.error("Login failed.")
         except Exception as e:
@@ -66,61 +110,211 @@ class Speakeasy:
                 else:
                     logging.error("Logout failed.")
             except Exception as e:
-                logging.error("An error occurred during logout:", e)
+                logging.error(f"An error occurred during logout: {e}")
         else:
             print("No active session to logout from.")
 
+    def _rooms_are_stale(self) -> bool:
+        """Whether the cached list of rooms may be refreshed under the request rate limit."""
+        if not self.session_token:
+            logging.error("No active session. Please login first.")
+            return False
+        elapsed_time = time.time() - self.__last_call_for_rooms
+        return elapsed_time >= self.rooms_refresh_interval
+
+    def _fetch_rooms(self):
+        """Blocking api call for the list of chat rooms info."""
+        return self.chat_api.get_api_rooms(session=self.session_token)
+
+    def _new_chatroom(self, room_info) -> Chatroom:
+        return self._chatroom_class(
+            room_id=room_info.uid,
+            my_alias=room_info.alias,
+            prompt=room_info.prompt,
+            start_time=room_info.start_time,
+            remaining_time=room_info.remaining_time,
+            user_aliases=room_info.user_aliases,
+            session_token=self.session_token,
+            chat_api=self.chat_api,
+            request_limit=self.__request_limit,
+            sender=self.sender,
+            coalesce_window=self.coalesce_window,
+            max_message_length=self.max_message_length,
+            history_size=self.history_size,
+            checkpoint_store=self.checkpoint,
+            checkpoint=self._checkpoints.get(room_info.uid),
+        )
+
+    def _apply_rooms(self, response, call_time: float):
+        """Merge an api response into the cached rooms."""
+        with self._rooms_guard:
+            if response:
+                chatroom_info_list = response.rooms
+                listed = set()
+                for room_info in chatroom_info_list:
+                    listed.add(room_info.uid)
+                    # Convert responses from api into Chatroom instances and add new chatrooms
+                    if room_info.uid not in self._chatrooms_dict.keys():
+                        self._chatrooms_dict[room_info.uid] = self._new_chatroom(room_info)
+                    else:  # update remaining_time of existing chatrooms
+                        self._chatrooms_dict[
+                            room_info.uid
+                        ].remaining_time = room_info.remaining_time
+                # rooms no longer listed by the server are over
+                for room_id, room in self._chatrooms_dict.items():
+                    if room_id not in listed:
+                        room.remaining_time = 0
+            else:
+                logging.error("Failed to fetch chat rooms.")
+            self.__last_call_for_rooms = call_time
+            self._notify_room_changes()
+
+    def _notify_room_changes(self):
+        """Call the callbacks of rooms that opened or closed since the last call."""
+        opened, closed = [], []
+        with self._rooms_guard:
+            for room_id, room in self._chatrooms_dict.items():
+                # remaining_time counts down locally between refreshes
+                is_open = room.remaining_time > 0
+                if is_open and room_id not in self._open_room_ids:
+                    self._open_room_ids.add(room_id)
+                    opened.append(room)
+                elif not is_open and room_id in self._open_room_ids:
+                    self._open_room_ids.discard(room_id)
+                    closed.append(room)
+
+        for callbacks, rooms in ((self._room_opened_callbacks, opened), (self._room_closed_callbacks, closed)):
+            for room in rooms:
+                for callback in callbacks:
+                    try:
+                        callback(room)
+                    except Exception as e:
+                        logging.error(f"An error occurred in a callback for room {room.room_id}: {e}")
+
+    def on_room_opened(self, callback: Callable[[Chatroom], None]):
+        """Call `callback(room)` for every newly discovered active room."""
+        self._room_opened_callbacks.append(callback)
+
+    def on_room_closed(self, callback: Callable[[Chatroom], None]):
+        """Call `callback(room)` once the remaining time of a discovered room ran out."""
+        self._room_closed_callbacks.append(callback)
+
     def __update_chat_rooms(self):
         """Cache the list of rooms and implement a request rate limit for this API call."""
-        if self.session_token:
-            current_time = time.time()
-            elapsed_time = current_time - self.__last_call_for_rooms
-            if elapsed_time >= self.__request_limit:
-                try:
-                    # Call the get_api_rooms endpoint to fetch the list of chat rooms info
-                    response = self.chat_api.get_api_rooms(session=self.session_token)
-                    if response:
-                        chatroom_info_list = response.rooms
-                        for room_info in chatroom_info_list:
-                            # Convert responses from api into Chatroom instances and add new chatrooms
-                            if room_info.uid not in self._chatrooms_dict.keys():
-                                self._chatrooms_dict[room_info.uid] = Chatroom(
-                                    room_id=room_info.uid,
-                                    my_alias=room_info.alias,
-                                    prompt=room_info.prompt,
-                                    start_time=room_info.start_time,
-                                    remaining_time=room_info.remaining_time,
-                                    user_aliases=room_info.user_aliases,
-                                    session_token=self.session_token,
-                                    chat_api=self.chat_api,
-                                    request_limit=self.__request_limit,
-                                )
-                            else:  # update remaining_time of existing chatrooms
-                                self._chatrooms_dict[
-                                    room_info.uid
-                                ].remaining_time = room_info.remaining_time
-                    else:
-                        logging.error("Failed to fetch chat rooms.")
-                    self.__last_call_for_rooms = current_time
-                except Exception as e:
-                    logging.error("An error occurred while fetching chat rooms:", e)
-        else:
-            logging.error("No active session. Please login first.")
+        if self._refresher is not None or not self._rooms_are_stale():
+            # the background refresher keeps the list up to date
+            return
+
+        current_time = time.time()
+        try:
+            # Call the get_api_rooms endpoint to fetch the list of chat rooms info
+            self._apply_rooms(self._fetch_rooms(), current_time)
+        except Exception as e:
+            logging.error(f"An error occurred while fetching chat rooms: {e}")
+
+    def _select_rooms(self, active: bool) -> List[Chatroom]:
+        if self._refresher is None:
+            # with the background refresher the callbacks are only called from its thread
+            self._notify_room_changes()
+        with self._rooms_guard:
+            rooms = list(self._chatrooms_dict.values())
+        if active:  # only returns active chatrooms (i.e., remaining_time > 0)
+            # remaining_time is decremented locally, so rooms that ran out between two refreshes
+            # are not returned and their apis are not called anymore
+            return [room for room in rooms if room.remaining_time > 0]
+
+        return rooms
 
     def get_rooms(
         self, active=True
     ) -> List[Chatroom]:  # includes non-active chatrooms (i.e., remaining_time == 0)
         self.__update_chat_rooms()
+        return self._select_rooms(active)
 
-        if active:  # only returns active chatrooms (i.e., remaining_time > 0)
-            # TODO: To avoid a lag in active detection that would make room's apis throw errors
-            #  (those apis only allow interactions for active rooms),
-            #  we can increase the threshold to
-            self.__request_limit = self.__request_limit * 1000
-            return [
-                room
-                for room in list(self._chatrooms_dict.values())
-                if room.remaining_time > 0
-            ]
-
-        return list(self._chatrooms_dict.values())
+    def start_room_refresher(self):
+        """Refresh the list of rooms every `rooms_refresh_interval` seconds in a background thread.
+
+        Opened and closed callbacks are then called from that thread, `get_rooms` returns the cached list.
+        """
+        if self._refresher is not None:
+            return
+        self._refresher_stop.clear()
+        self._refresher = threading.Thread(target=self.__refresh_rooms, name="speakeasy-rooms", daemon=True)
+        self._refresher.start()
+
+    def stop_room_refresher(self):
+        if self._refresher is None:
+            return
+        self._refresher_stop.set()
+        self._refresher.join()
+        self._refresher = None
+
+    def __refresh_rooms(self):
+        while not self._refresher_stop.is_set():
+            if self._rooms_are_stale():
+                current_time = time.time()
+                try:
+                    self._apply_rooms(self._fetch_rooms(), current_time)
+                except Exception as e:
+                    logging.error(f"An error occurred while fetching chat rooms: {e}")
+            else:
+                # rooms whose remaining time ran out locally
+                self._notify_room_changes()
+            self._refresher_stop.wait(min(1.0, self.rooms_refresh_interval))
+
+    def events(
+        self,
+        min_interval: float = 1,
+        max_interval: float = 30,
+        only_partner: bool = True,
+        auto_ack: bool = True,
+    ) -> Iterator[Event]:
+        """Yield the new messages and reactions of all active rooms as MessageEvent and ReactionEvent.
+
+        Rooms are polled by a PollScheduler, busy rooms every `min_interval` seconds and idle ones with
+        backoff up to `max_interval`. With `auto_ack` an event is marked as processed once the consumer asks
+        for the next one. Without it the consumer marks `event.item` as processed itself, possibly later from
+        another thread, and an event is not yielded again while it waits for that.
+        """
+        scheduler = PollScheduler(self, min_interval, max_interval, only_partner=only_partner)
+        # keys of the events yielded but not yet acknowledged, per room
+        unacked: Dict[str, Set[Tuple]] = {}
+        while True:
+            for room, messages, reactions in scheduler.poll():
+                pending = unacked.get(room.room_id, set())
+                keys = set()
+                for event in [MessageEvent(room, m) for m in messages] + [ReactionEvent(room, r) for r in reactions]:
+                    keys.add(event.key)
+                    if event.key in pending:
+                        continue
+                    yield event
+                    if auto_ack:
+                        room.mark_as_processed(event.item)
+                if not auto_ack:
+                    # acknowledged events are no longer new, forget them
+                    unacked[room.room_id] = keys
+
+    def on_message(self, callback: Callable[[MessageEvent], None]):
+        """Call `callback(event)` for every new message when `run` is used."""
+        self._message_callbacks.append(callback)
+
+    def on_reaction(self, callback: Callable[[ReactionEvent], None]):
+        """Call `callback(event)` for every new reaction when `run` is used."""
+        self._reaction_callbacks.append(callback)
+
+    def run(self, **kwargs):
+        """Pass the `events` (with the same arguments) to the registered callbacks, until interrupted.
+
+        With `auto_ack` (the default) an event is marked as processed after its callbacks returned, also when
+        one of them raised.
+        """
+        for event in self.events(**kwargs):
+            if isinstance(event, MessageEvent):
+                callbacks = self._message_callbacks
+            else:
+                callbacks = self._reaction_callbacks
+            for callback in callbacks:
+                try:
+                    callback(event)
+                except Exception as e:
+                    logging.error(f"An error occurred while handling {event.key} in room {event.room.room_id}: {e}")
@@ -0,0 +1,16 @@
+import os
+import sys
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# speakeasypy is imported from the checkout, the usecases modules import each
+# other by module name
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "usecases"))
+
+# speakeasypy/__init__.py logs the demo bot in and fetches its rooms, register
+# the package without running it so the tests never touch the network
+_package = types.ModuleType("speakeasypy")
+_package.__path__ = [os.path.join(ROOT, "speakeasypy")]
+sys.modules["speakeasypy"] = _package
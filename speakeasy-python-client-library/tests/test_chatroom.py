@@ -0,0 +1,148 @@
+from types import SimpleNamespace
+
+from speakeasypy.openapi.client.models import RestChatMessage, ChatMessageReaction
+from speakeasypy.src.chatroom import Chatroom
+from speakeasypy.src.checkpoint import RoomCheckpoint
+
+BOT = "bot"
+PARTNER = "partner"
+
+
+class FakeChatApi:
+    """Answers every state request with the next queued response."""
+
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.since = []
+
+    def get_api_room_with_roomid_with_since(self, room_id, since, session):
+        self.since.append(since)
+        return self.responses.pop(0)
+
+
+def state(messages=(), reactions=()):
+    return SimpleNamespace(messages=list(messages), reactions=list(reactions))
+
+
+def message(ordinal, author=PARTNER):
+    return RestChatMessage(
+        time_stamp=1000 + ordinal, author_alias=author, ordinal=ordinal, message=f"message {ordinal}"
+    )
+
+
+def reaction(ordinal, reaction_type="THUMBS_UP"):
+    return ChatMessageReaction(message_ordinal=ordinal, type=reaction_type)
+
+
+def make_room(*responses, **kwargs):
+    return Chatroom(
+        room_id="room",
+        my_alias=BOT,
+        prompt="",
+        start_time=0,
+        remaining_time=60000,
+        user_aliases=[BOT, PARTNER],
+        session_token="token",
+        chat_api=FakeChatApi(*responses),
+        request_limit=0,
+        **kwargs,
+    )
+
+
+def ordinals(messages):
+    return [m.ordinal for m in messages]
+
+
+def test_watermark_starts_at_the_oldest_message_of_the_first_response():
+    room = make_room(state([message(5), message(6), message(7)]))
+
+    assert ordinals(room.get_messages()) == [5, 6, 7]
+    assert room.processed_watermark == 5
+
+
+def test_checkpointed_watermark_is_not_lowered_by_the_first_response():
+    checkpoint = RoomCheckpoint(watermark=7, initiated=True, messages={8}, reactions=set())
+    room = make_room(state([message(5), message(6), message(7), message(8), message(9)]), checkpoint=checkpoint)
+
+    assert ordinals(room.get_messages()) == [7, 9]
+    assert room.processed_watermark == 7
+    assert room.initiated
+
+
+def test_compaction_advances_over_bot_messages():
+    room = make_room(state([message(0), message(1, BOT), message(2), message(3, BOT), message(4)]))
+    new = room.get_messages()
+    assert ordinals(new) == [0, 2, 4]
+
+    room.mark_as_processed(new[0])
+    # ordinal 1 was sent by the bot and needs no processing
+    assert room.processed_watermark == 2
+    assert room.processed_ordinals['messages'] == {3}
+
+    room.mark_as_processed(new[1])
+    assert room.processed_watermark == 4
+    assert room.processed_ordinals['messages'] == set()
+    assert ordinals(room.get_messages()) == [4]
+
+
+def test_out_of_order_processing_keeps_the_gap_open():
+    room = make_room(state([message(0), message(1), message(2)]))
+    first, second, third = room.get_messages()
+
+    room.mark_as_processed(third)
+    room.mark_as_processed(second)
+    assert room.processed_watermark == 0
+    assert room.processed_ordinals['messages'] == {1, 2}
+    assert ordinals(room.get_messages()) == [0]
+
+    room.mark_as_processed(first)
+    assert room.processed_watermark == 3
+    assert room.processed_ordinals['messages'] == set()
+    assert room.get_messages() == []
+
+
+def test_history_evicts_only_processed_messages():
+    room = make_room(
+        state([message(i) for i in range(4)]),
+        state(),
+        history_size=2,
+    )
+    for m in room.get_messages():
+        room.mark_as_processed(m)
+    assert ordinals(room.get_messages(only_new=False)) == [2, 3]
+
+    room = make_room(state([message(i) for i in range(4)]), history_size=2)
+    # nothing is processed yet, so nothing may be dropped
+    assert ordinals(room.get_messages(only_new=False)) == [0, 1, 2, 3]
+
+
+def test_evicted_messages_are_not_added_again():
+    old = [message(i) for i in range(3)]
+    room = make_room(state(old), state(old + [message(3)]), state(), history_size=1)
+    for m in room.get_messages():
+        room.mark_as_processed(m)
+
+    assert ordinals(room.get_messages()) == [3]
+    assert ordinals(room.get_messages(only_new=False)) == [3]
+
+
+def test_requests_messages_since_the_newest_cached_one():
+    room = make_room(state([message(0), message(1)]), state([message(2)]))
+    room.get_messages()
+    room.get_messages()
+
+    assert room.chat_api.since == [0, 1001]
+
+
+def test_reactions_are_diffed_by_message_and_type():
+    room = make_room(
+        state([message(0)], [reaction(0)]),
+        state([], [reaction(0), reaction(0, "STAR")]),
+    )
+    new = room.get_reactions()
+    assert [(r.message_ordinal, r.type) for r in new] == [(0, "THUMBS_UP")]
+    room.mark_as_processed(new[0])
+
+    new = room.get_reactions()
+    assert [(r.message_ordinal, r.type) for r in new] == [(0, "STAR")]
+    assert len(room.get_reactions(only_new=False)) == 2
@@ -0,0 +1,88 @@
+import pytest
+from rdflib import BNode, Literal, URIRef
+from rdflib.namespace import RDFS, XSD
+
+from graph_store import TripleStore, decode_term, encode_term
+
+WD = "http://www.wikidata.org/entity/"
+
+TERMS = [
+    URIRef(WD + "Q1"),
+    URIRef(WD + "Q10"),
+    URIRef(WD + "Q2"),
+    URIRef("http://example.org/café"),
+    BNode("b0"),
+    Literal("Star Wars"),
+    Literal("Star Wars", lang="en"),
+    Literal("Star Wars", lang="de"),
+    Literal("1977", datatype=XSD.gYear),
+    Literal("Amélie"),
+    Literal("ゴジラ", lang="ja"),
+    Literal("\U0001f3ac"),
+    Literal(""),
+]
+
+
+@pytest.mark.parametrize("term", TERMS, ids=repr)
+def test_encode_decode_round_trip(term):
+    decoded = decode_term(encode_term(term))
+
+    assert decoded == term
+    assert type(decoded) is type(term)
+    if isinstance(term, Literal):
+        assert decoded.language == term.language
+        assert decoded.datatype == term.datatype
+
+
+def test_literals_differing_in_language_or_datatype_encode_differently():
+    keys = {
+        encode_term(Literal("1")),
+        encode_term(Literal("1", lang="en")),
+        encode_term(Literal("1", datatype=XSD.integer)),
+        encode_term(URIRef("1")),
+        encode_term(BNode("1")),
+    }
+    assert len(keys) == 5
+
+
+def test_encode_rejects_none():
+    with pytest.raises(TypeError):
+        encode_term(None)
+
+
+@pytest.fixture
+def store():
+    triples = [(TERMS[i % 3], RDFS.label, term) for i, term in enumerate(TERMS[3:])]
+    return TripleStore.from_triples(triples)
+
+
+def test_term_ids_follow_the_byte_order_of_the_encoding(store):
+    encoded = [encode_term(store.term(i)) for i in range(store.n_terms)]
+
+    assert encoded == sorted(encoded)
+    assert store.n_terms == len(TERMS) + 1  # the terms and rdfs:label
+
+
+def test_term_id_round_trip(store):
+    for term in TERMS + [RDFS.label]:
+        term_id = store.term_id(term)
+        assert term_id is not None
+        assert store.term(term_id) == term
+
+
+def test_term_id_of_unknown_terms(store):
+    assert store.term_id(URIRef(WD + "Q3")) is None
+    assert store.term_id(Literal("Star Wars", lang="fr")) is None
+    # sorts before and after every stored term
+    assert store.term_id(BNode("")) is None
+    assert store.term_id(URIRef("\U0010ffff")) is None
+
+
+def test_objects_and_subjects(store, tmp_path):
+    store.save(str(tmp_path))
+    mapped = TripleStore.load(str(tmp_path), mmap_mode="r")
+
+    for s in (store, mapped):
+        assert set(s.objects(TERMS[0], RDFS.label)) == {TERMS[3], TERMS[6], TERMS[9], TERMS[12]}
+        assert list(s.subjects(RDFS.label, TERMS[4])) == [TERMS[1]]
+        assert list(s.objects(URIRef(WD + "Q3"), RDFS.label)) == []
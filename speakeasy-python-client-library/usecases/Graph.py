@@ -1,10 +1,15 @@
 import os
 import pickle
-from typing import List
+from typing import FrozenSet, List, Set, Tuple
+import numpy as np
 import rdflib
 from rdflib import Namespace, query
-from rdflib.term import IdentifiedNode
+from rdflib.term import IdentifiedNode, URIRef
 import utils
+from entity_ids import EntityIdTable, EntityLabelTable
+from graph_store import TripleStore
+from label_index import FilmLabelIndex
+from sidecars import is_fresh, save_atomic
 
 WD = Namespace("http://www.wikidata.org/entity/")
 WDT = Namespace("http://www.wikidata.org/prop/direct/")
@@ -19,20 +24,161 @@ HEADER_CONST = """
         PREFIX schema: <http://schema.org/>
     """
 
+FILM_CLASS = WD.Q2431196
+
 
 class Graph:
     def __init__(self, filepath: str):
-        with open(filepath, "rb") as graph:
-            self.g: rdflib.Graph = pickle.load(graph)
+        """`filepath` is either a pickled rdflib graph or a TripleStore
+        directory written by data/dump_graph_store.py."""
+        self.store: TripleStore | None = None
+        self._g: rdflib.Graph | None = None
+
+        if TripleStore.is_store(filepath):
+            self.store = TripleStore.load(filepath, mmap_mode="r")
+            source_path = os.path.join(filepath, "spo_s.npy")
+            films_path = os.path.join(filepath, "films.npz")
+        else:
+            with open(filepath, "rb") as graph:
+                self._g = pickle.load(graph)
+            source_path = filepath
+            films_path = os.path.splitext(filepath)[0] + ".films.npz"
+
+        # closure of wdt:P279 under the film class and its instances, so no
+        # lookup has to walk `wdt:P31/wdt:P279*` at query time
+        self.source_path = source_path
+        self._film_classes, self._films = self._load_or_build_films(
+            films_path, source_path
+        )
+
+        # answers get_movie_with_label without a SPARQL REGEX scan per message
+        self.film_labels = FilmLabelIndex(self._films_with_labels())
+
+        # dense labels of the embedding entities, see use_label_table
+        self.label_table: EntityLabelTable | None = None
+        self.entity_ids: EntityIdTable | None = None
+
+    @property
+    def g(self) -> rdflib.Graph:
+        # free-form SPARQL needs rdflib, a store is only materialised on demand
+        if self._g is None:
+            self._g = self.store.to_rdflib()
+        return self._g
 
     def entity_to_label(self, entity: IdentifiedNode) -> IdentifiedNode | None:
+        if self.store is not None:
+            return next(self.store.objects(entity, RDFS.label), None)
+
         for x in self.g.objects(entity, RDFS.label, True):
             return x
         return None
 
+    def use_label_table(
+        self, path: str, entity_ids: EntityIdTable, entity_ids_path: str
+    ):
+        """Label embedding entities from a row-aligned table stored at `path`,
+        built from this graph on first use and rebuilt when the graph or
+        `entity_ids_path` (the entity_ids.del of `entity_ids`) changed."""
+        self.entity_ids = entity_ids
+        self.label_table = EntityLabelTable.load_or_build(
+            path,
+            entity_ids,
+            self.entity_to_label,
+            (self.source_path, entity_ids_path),
+        )
+
+    def entities_to_labels(
+        self, entities: List[IdentifiedNode | None]
+    ) -> List[str | None]:
+        """Labels of many entities, a single gather for embedding entities.
+
+        A None entity (e.g. no embedding answer) has no label, it is never
+        passed to the graph where it would act as a wildcard."""
+        if self.label_table is None:
+            labels = [
+                None if entity is None else self.entity_to_label(entity)
+                for entity in entities
+            ]
+            return [None if label is None else str(label) for label in labels]
+
+        labels = self.label_table.labels_of(entities, self.entity_ids)
+        # entities outside the embedding table still go through the graph
+        for i, label in enumerate(labels):
+            if entities[i] is None:
+                labels[i] = None
+            elif label is None and entities[i] not in self.entity_ids:
+                label = self.entity_to_label(entities[i])
+                labels[i] = None if label is None else str(label)
+        return labels
+
+    def is_film(self, entity: IdentifiedNode) -> bool:
+        return entity in self._films
+
+    def films(self) -> FrozenSet[IdentifiedNode]:
+        return self._films
+
+    def film_classes(self) -> FrozenSet[IdentifiedNode]:
+        return self._film_classes
+
+    def _subjects(self, predicate: IdentifiedNode, obj: IdentifiedNode):
+        if self.store is not None:
+            return self.store.subjects(predicate, obj)
+        return self.g.subjects(predicate, obj)
+
+    def _build_films(self) -> Tuple[Set[IdentifiedNode], Set[IdentifiedNode]]:
+        classes, frontier = {FILM_CLASS}, [FILM_CLASS]
+        while frontier:
+            for c in self._subjects(WDT.P279, frontier.pop()):
+                if isinstance(c, URIRef) and c not in classes:
+                    classes.add(c)
+                    frontier.append(c)
+
+        films = set()
+        for c in classes:
+            films.update(f for f in self._subjects(WDT.P31, c) if isinstance(f, URIRef))
+        return classes, films
+
+    def _load_or_build_films(
+        self, films_path: str, source_path: str
+    ) -> Tuple[FrozenSet[IdentifiedNode], FrozenSet[IdentifiedNode]]:
+        if is_fresh(films_path, source_path):
+            with np.load(films_path) as data:
+                classes = {URIRef(c) for c in data["film_classes"]}
+                films = {URIRef(f) for f in data["films"]}
+        else:
+            classes, films = self._build_films()
+            save_atomic(
+                films_path,
+                lambda f: np.savez(
+                    f,
+                    film_classes=np.array(sorted(classes), dtype=str),
+                    films=np.array(sorted(films), dtype=str),
+                ),
+            )
+        return frozenset(classes), frozenset(films)
+
+    def _films_with_labels(self):
+        if self.store is None:
+            return [
+                (film, label)
+                for film in self._films
+                for label in self.g.objects(film, RDFS.label)
+            ]
+
+        label_id = self.store.term_id(RDFS.label)
+        if label_id is None:
+            return []
+        film_ids = {self.store.term_id(film) for film in self._films}
+        subjects, objects = self.store.predicate_pairs(label_id)
+        return [
+            (self.store.term(s_id), self.store.term(o_id))
+            for s_id, o_id in zip(subjects.tolist(), objects.tolist())
+            if s_id in film_ids
+        ]
+
     def get_movie_with_label(self, film_name: str) -> List[IdentifiedNode]:
-        query = utils.GET_FILM_BY_NAME_FILTER % {
-            "filmName": utils.lower_remove_sent_endings_at_end(film_name)
-        }
-        res = list(self.g.query(HEADER_CONST + query))
-        return res[0] if len(res) > 0 else []
+        matches = self.film_labels.lookup(film_name, limit=1)
+        if not matches:
+            # NER spans with typos or different punctuation, best similar title
+            matches = self.film_labels.fuzzy_lookup(film_name, k=1)
+        return list(matches[0][:2]) if matches else []
@@ -0,0 +1,258 @@
+import os
+import numpy as np
+from typing import Tuple
+
+from sidecars import is_fresh, save_atomic
+
+# rows per block when assigning vectors to centroids or upcasting half
+# precision storage, keeps temporaries small for large embedding tables
+_BLOCK = 16384
+
+
+def select_top_k(dist: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k smallest distances, ordered best first."""
+    k = min(k, dist.shape[-1])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k == 1:
+        return np.array([dist.argmin()])
+
+    # partial selection is O(N), only the k survivors get sorted
+    candidates = np.argpartition(dist, k - 1)[:k]
+    return candidates[np.argsort(dist[candidates])]
+
+
+def select_top_k_rows(dist: np.ndarray, k: int) -> np.ndarray:
+    """Row-wise `select_top_k` for a (queries x vectors) distance matrix."""
+    k = min(k, dist.shape[1])
+    if k <= 0:
+        return np.empty((dist.shape[0], 0), dtype=np.int64)
+
+    candidates = np.argpartition(dist, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(dist, candidates, axis=1), axis=1)
+    return np.take_along_axis(candidates, order, axis=1)
+
+
+def compute_dtype(vectors: np.ndarray) -> np.dtype:
+    """float16 storage is computed in float32, wider types are kept."""
+    return np.result_type(vectors.dtype, np.float32)
+
+
+def squared_norms(vectors: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", vectors, vectors, dtype=compute_dtype(vectors))
+
+
+def matvec(vectors: np.ndarray, query: np.ndarray) -> np.ndarray:
+    """`vectors @ query` for a single (d,) query or a (d, m) block of queries."""
+    if vectors.dtype == query.dtype:
+        return vectors @ query
+
+    # half precision has no BLAS path, upcast block by block instead
+    out = np.empty(vectors.shape[:1] + query.shape[1:], dtype=query.dtype)
+    for start in range(0, vectors.shape[0], _BLOCK):
+        out[start : start + _BLOCK] = (
+            vectors[start : start + _BLOCK].astype(query.dtype) @ query
+        )
+    return out
+
+
+class ExactIndex(object):
+    """Brute-force L2 search over every vector."""
+
+    def __init__(self, vectors: np.ndarray, sq_norms: np.ndarray | None = None):
+        self.vectors = vectors
+        self.sq_norms = squared_norms(vectors) if sq_norms is None else sq_norms
+        self.dtype = compute_dtype(vectors)
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        query = query.astype(self.dtype, copy=False)
+        # ||e - q||^2 = ||e||^2 - 2 e.q + ||q||^2
+        dist = self.sq_norms - 2 * matvec(self.vectors, query) + query @ query
+        best = select_top_k(dist, k)
+        return best, dist[best]
+
+    def batch_search(
+        self, queries: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Top-k for a (m x d) block of queries with one matrix-matrix product."""
+        queries = queries.astype(self.dtype, copy=False)
+        dist = (
+            self.sq_norms[None, :]
+            - 2 * matvec(self.vectors, queries.T).T
+            + squared_norms(queries)[:, None]
+        )
+        best = select_top_k_rows(dist, k)
+        return best, np.take_along_axis(dist, best, axis=1)
+
+
+class IVFIndex(ExactIndex):
+    """Inverted-file index: vectors are bucketed by their nearest k-means
+    centroid and a query only scans the `n_probe` closest buckets.
+
+    `n_probe` is the recall/latency knob, with `n_probe >= n_lists` the
+    search is exact. Queries whose probed buckets hold fewer than k vectors
+    fall back to exact search.
+    """
+
+    def __init__(
+        self,
+        vectors: np.ndarray,
+        centroids: np.ndarray,
+        order: np.ndarray,
+        offsets: np.ndarray,
+        n_probe: int = 8,
+        sq_norms: np.ndarray | None = None,
+    ):
+        super().__init__(vectors, sq_norms)
+        self.centroids = centroids
+        self.centroid_sq_norms = squared_norms(centroids)
+        # vector ids grouped by bucket, bucket i is order[offsets[i]:offsets[i + 1]]
+        self.order = order
+        self.offsets = offsets
+        self.n_probe = n_probe
+
+    @property
+    def n_lists(self) -> int:
+        return self.centroids.shape[0]
+
+    @classmethod
+    def build(
+        cls,
+        vectors: np.ndarray,
+        n_lists: int | None = None,
+        n_iter: int = 10,
+        n_probe: int = 8,
+        seed: int = 0,
+        sq_norms: np.ndarray | None = None,
+    ) -> "IVFIndex":
+        if sq_norms is None:
+            sq_norms = squared_norms(vectors)
+        if n_lists is None:
+            n_lists = max(1, int(np.sqrt(vectors.shape[0])))
+        n_lists = min(n_lists, vectors.shape[0])
+
+        rng = np.random.default_rng(seed)
+        init = rng.choice(vectors.shape[0], size=n_lists, replace=False)
+        centroids = np.array(vectors[np.sort(init)], dtype=np.float32)
+
+        for _ in range(n_iter):
+            assignment = cls._assign(vectors, sq_norms, centroids)
+            order = np.argsort(assignment, kind="stable")
+            counts = np.bincount(assignment, minlength=n_lists)
+            filled = np.flatnonzero(counts)
+            starts = np.concatenate(([0], np.cumsum(counts)[:-1]))[filled]
+            sums = np.add.reduceat(vectors[order], starts, axis=0, dtype=np.float32)
+            # empty buckets keep their previous centroid
+            centroids[filled] = sums / counts[filled, None]
+
+        assignment = cls._assign(vectors, sq_norms, centroids)
+        order = np.argsort(assignment, kind="stable")
+        offsets = np.concatenate(
+            ([0], np.cumsum(np.bincount(assignment, minlength=n_lists)))
+        )
+        return cls(vectors, centroids, order, offsets, n_probe, sq_norms)
+
+    @staticmethod
+    def _assign(
+        vectors: np.ndarray, sq_norms: np.ndarray, centroids: np.ndarray
+    ) -> np.ndarray:
+        centroid_sq_norms = squared_norms(centroids)
+        assignment = np.empty(vectors.shape[0], dtype=np.int64)
+        for start in range(0, vectors.shape[0], _BLOCK):
+            block = vectors[start : start + _BLOCK].astype(centroids.dtype)
+            dist = (
+                sq_norms[start : start + _BLOCK, None]
+                - 2 * (block @ centroids.T)
+                + centroid_sq_norms
+            )
+            assignment[start : start + block.shape[0]] = dist.argmin(axis=1)
+        return assignment
+
+    def save(self, path: str):
+        save_atomic(
+            path,
+            lambda f: np.savez(
+                f,
+                centroids=self.centroids,
+                order=self.order,
+                offsets=self.offsets,
+                shape=np.array(self.vectors.shape),
+            ),
+        )
+
+    @classmethod
+    def load(
+        cls,
+        path: str,
+        vectors: np.ndarray,
+        n_probe: int = 8,
+        sq_norms: np.ndarray | None = None,
+    ) -> "IVFIndex | None":
+        """Load a saved index, returns None if it was built for other vectors."""
+        with np.load(path) as data:
+            if tuple(data["shape"]) != vectors.shape:
+                return None
+            return cls(
+                vectors,
+                data["centroids"],
+                data["order"],
+                data["offsets"],
+                n_probe,
+                sq_norms,
+            )
+
+    @classmethod
+    def load_or_build(
+        cls,
+        path: str,
+        vectors: np.ndarray,
+        n_probe: int = 8,
+        sq_norms: np.ndarray | None = None,
+        source_path: str | None = None,
+    ) -> "IVFIndex":
+        """Load the index saved at `path`, (re)building it when it was built
+        for vectors of another shape or `source_path` (the file `vectors`
+        were loaded from) is newer."""
+        index = None
+        if os.path.exists(path) and (
+            source_path is None or is_fresh(path, source_path)
+        ):
+            index = cls.load(path, vectors, n_probe, sq_norms)
+        if index is None:
+            index = cls.build(vectors, n_probe=n_probe, sq_norms=sq_norms)
+            index.save(path)
+        return index
+
+    def search(self, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        if self.n_probe >= self.n_lists:
+            return super().search(query, k)
+
+        query = query.astype(self.dtype, copy=False)
+        centroid_dist = self.centroid_sq_norms - 2 * (self.centroids @ query)
+        probed = select_top_k(centroid_dist, self.n_probe)
+        candidates = np.concatenate(
+            [self.order[self.offsets[c] : self.offsets[c + 1]] for c in probed]
+        )
+        if candidates.shape[0] < k:
+            return super().search(query, k)
+
+        dist = (
+            self.sq_norms[candidates]
+            - 2 * matvec(self.vectors[candidates], query)
+            + query @ query
+        )
+        best = select_top_k(dist, k)
+        return candidates[best], dist[best]
+
+    def batch_search(
+        self, queries: np.ndarray, k: int
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        if self.n_probe >= self.n_lists:
+            return super().batch_search(queries, k)
+
+        # probed buckets differ per query, so every row is its own small scan
+        results = [self.search(query, k) for query in queries]
+        k = min(k, self.vectors.shape[0])
+        ids = np.array([r[0] for r in results], dtype=np.int64).reshape(-1, k)
+        dist = np.array([r[1] for r in results], dtype=self.dtype).reshape(-1, k)
+        return ids, dist
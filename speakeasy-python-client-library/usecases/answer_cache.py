@@ -0,0 +1,144 @@
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Hashable, Tuple
+
+from sidecars import save_atomic
+
+# relation keys are packed into the low bits of the int64 table key
+_RELATION_BITS = 16
+
+
+def _pack_keys(ent_ids: np.ndarray, relation_keys: np.ndarray) -> np.ndarray:
+    return (np.asarray(ent_ids, dtype=np.int64) << _RELATION_BITS) | np.asarray(
+        relation_keys, dtype=np.int64
+    )
+
+
+class PrecomputedAnswers(object):
+    """Compact on-disk table of top-k answers for (ent_id, relation_key) pairs.
+
+    Keys are sorted packed int64s searched with binary search, answers are a
+    (pairs x k) int32 matrix of entity rows with float32 distances. `source`
+    fingerprints the embeddings the answers were computed from, see
+    `EmbeddingAnswerer.answers_source`.
+    """
+
+    def __init__(
+        self,
+        keys: np.ndarray,
+        ids: np.ndarray,
+        dists: np.ndarray,
+        source: np.ndarray | None = None,
+    ):
+        self.keys = keys
+        self.ids = ids
+        self.dists = dists
+        self.source = np.empty(0) if source is None else source
+
+    def __len__(self) -> int:
+        return self.keys.shape[0]
+
+    @property
+    def k(self) -> int:
+        return self.ids.shape[1]
+
+    @classmethod
+    def from_answers(
+        cls,
+        ent_ids: np.ndarray,
+        relation_keys: np.ndarray,
+        ids: np.ndarray,
+        dists: np.ndarray,
+        source: np.ndarray | None = None,
+    ) -> "PrecomputedAnswers":
+        keys = _pack_keys(ent_ids, relation_keys)
+        order = np.argsort(keys, kind="stable")
+        return cls(
+            keys[order],
+            ids[order].astype(np.int32),
+            dists[order].astype(np.float32),
+            source,
+        )
+
+    def save(self, path: str):
+        save_atomic(
+            path,
+            lambda f: np.savez(
+                f, keys=self.keys, ids=self.ids, dists=self.dists, source=self.source
+            ),
+        )
+
+    @classmethod
+    def load(
+        cls, path: str, source: np.ndarray | None = None
+    ) -> "PrecomputedAnswers | None":
+        """Load a saved table, returns None if it was computed from embeddings
+        other than `source` describes."""
+        with np.load(path) as data:
+            if source is not None and (
+                "source" not in data or not np.array_equal(data["source"], source)
+            ):
+                return None
+            return cls(
+                data["keys"],
+                data["ids"],
+                data["dists"],
+                data["source"] if "source" in data else None,
+            )
+
+    def lookup(
+        self, ent_id: int, relation_key: int, k: int
+    ) -> Tuple[np.ndarray, np.ndarray] | None:
+        """Stored answer rows and squared distances, None if not precomputed
+        or precomputed with a smaller k."""
+        if k > self.k:
+            return None
+
+        key = int(_pack_keys(ent_id, relation_key))
+        pos = np.searchsorted(self.keys, key)
+        if pos >= self.keys.shape[0] or self.keys[pos] != key:
+            return None
+        return self.ids[pos, :k], self.dists[pos, :k]
+
+
+class AnswerCache(object):
+    """Bounded LRU with hit and miss counters, e.g. mapping
+    (ent_id, relation_key, k) to answer lists or SPARQL text to results.
+
+    Safe to share between the listener's worker threads.
+    """
+
+    def __init__(self, max_size: int = 4096):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: Hashable, value):
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,14 @@
+# convert the knowledge graph into a memory-mappable TripleStore directory,
+# pass that directory to Graph instead of the pickle
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_store import TripleStore
+
+data_folder = os.path.dirname(os.path.abspath(__file__))
+
+store = TripleStore.from_nt("speakeasy-python-client-library/graph/14_graph.nt")
+store.save(os.path.join(data_folder, "graph_store"))
+print(f"Stored {len(store)} triples over {store.n_terms} terms.")
@@ -0,0 +1,25 @@
+# precompute embedding answers for every film x the most asked relations,
+# EmbeddingAnswerer serves them from entity_answers.npz once it exists
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Graph import Graph
+from embeddings import (
+    COMMON_FILM_RELATIONS,
+    LABELS_IN_RELATION_IDS_DEL,
+    EmbeddingAnswerer,
+)
+
+data_folder = os.path.dirname(os.path.abspath(__file__))
+
+graph = Graph(os.path.join(data_folder, "pickle_graph.pickel"))
+films = sorted(graph.films())
+
+answerer = EmbeddingAnswerer(cache_size=0)
+table = answerer.precompute_answers(
+    films, [LABELS_IN_RELATION_IDS_DEL[label] for label in COMMON_FILM_RELATIONS]
+)
+table.save(os.path.join(data_folder, "entity_answers.npz"))
+print(f"Stored {len(table)} answers for {len(films)} films.")
@@ -1,10 +1,12 @@
 from rdflib import Graph, URIRef
-from speakeasypy import Speakeasy, Chatroom
+from speakeasypy import Speakeasy, Chatroom, MessageEvent
 from typing import List
 from nltk.corpus import wordnet as wn
 from transformers import pipeline, set_seed
 from sklearn.metrics import pairwise_distances
 import time
+import functools
+import itertools
 import pickle
 import re  # Regular expressions
 import spacy
@@ -13,9 +15,27 @@ import numpy as np
 import csv
 import os
 from entity_classification import EntryClassifier
+from sparql import (
+    GuardedSparql,
+    SparqlCache,
+    SparqlTimeout,
+    chunk_lines,
+    format_rows,
+)
+from room_dispatcher import RoomDispatcher
 
 DEFAULT_HOST_URL = "https://speakeasy.ifi.uzh.ch"
-listen_freq = 2
+listen_freq = 2  # seconds between polls of a room with new messages
+listen_max_freq = 30  # longest pause between polls of an idle room
+sparql_timeout = 10  # seconds before a running SPARQL query is killed
+sparql_max_rows = 100
+max_message_length = 1000  # longer answers are split into several posts
+listen_workers = 4  # rooms answered concurrently, 0 answers them one by one
+post_coalesce_window = 0.5  # seconds, posts within it are sent as one message
+# processed messages and welcomed rooms survive restarts of the bot
+checkpoint_path = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "data", "checkpoints.sqlite"
+)
 
 
 class Agent:
@@ -23,46 +43,42 @@ class Agent:
         self.username = username
         # Initialize the Speakeasy Python framework and login.
         self.speakeasy = Speakeasy(
-            host=DEFAULT_HOST_URL, username=username, password=password
+            host=DEFAULT_HOST_URL,
+            username=username,
+            password=password,
+            coalesce_window=post_coalesce_window,
+            max_message_length=max_message_length,
+            checkpoint_path=checkpoint_path,
         )
         self.speakeasy.login()  # This framework will help you log out automatically when the program terminates.
         self.ec = EntryClassifier()
+        # prepared-query and result caches over the classifier's graph, run in a
+        # worker process so one expensive query cannot block every chat room.
+        # Created here, before listen starts any threads, as it forks.
+        self.sparql = GuardedSparql(
+            SparqlCache(self.ec.graph), sparql_timeout, sparql_max_rows
+        )
 
-    def handle_none(self, query):
-        return self.handle_utf8("None" if query is None else str(query))
-
-    def sparql_query(self, query):
+    def sparql_query(self, query) -> List[str]:
+        """Answer a SPARQL message as one or more chat posts."""
         # clean input
         query = query.replace("'''", "\n")
         query = query.replace("‘’’", "\n")
         query = query.replace("PREFIX", "\nPREFIX")
 
         try:
-            result = self.graph.query(query)
-            # Handle different conditions
-            processed_result = []
-            for item in result:
-                try:
-                    # Unpack as (str, int)
-                    s, nc = item
-                    processed_result.append(
-                        (str(self.handle_none(s)), int(self.handle_none(nc)))
-                    )
-                except ValueError:
-                    try:
-                        # Unpack as (str, str)
-                        s, nc = item
-                        processed_result.append(
-                            (str(self.handle_none(s)), str(self.handle_none(nc)))
-                        )
-                    except ValueError:
-                        # String value
-                        processed_result.append(str(self.handle_none(item[0])))
-            result = processed_result
+            rows, truncated = self.sparql.rows(query)
+            lines = format_rows(rows, sparql_max_rows)
+            if truncated:
+                lines = itertools.chain(
+                    lines, [f"(only the first {sparql_max_rows} rows are shown)"]
+                )
+            posts = list(chunk_lines(lines, max_message_length))
+            return posts if posts else ["The query has no results."]
+        except SparqlTimeout:
+            return [f"Timeout: the query took longer than {sparql_timeout} seconds"]
         except Exception as e:
-            result = f"Error: {str(e)}"
-
-        return result
+            return [f"Error: {str(e)}"]
 
     @staticmethod
     def is_sparql(query):
@@ -73,63 +89,87 @@ class Agent:
             for keyword in sparql_keywords
         )
 
-    def listen(self):
-        while True:
-            # only check active chatrooms (i.e., remaining_time > 0) if active=True.
-            rooms: List[Chatroom] = self.speakeasy.get_rooms(active=True)
-            for room in rooms:
-                if not room.initiated:
-                    # send a welcome message if room is not initiated
-                    room.post_messages(
-                        f"Hello! This is a welcome message from {room.my_alias}."
-                    )
-                    room.initiated = True
-                # Retrieve messages from this chat room.
-                # If only_partner=True, it filters out messages sent by the current bot.
-                # If only_new=True, it filters out messages that have already been marked as processed.
-                for message in room.get_messages(only_partner=True, only_new=True):
-                    print(
-                        f"\t- Chatroom {room.room_id} "
-                        f"- new message #{message.ordinal}: '{message.message}' "
-                        f"- {self.get_time()}"
-                    )
+    def handle_message(self, room: Chatroom, message):
+        print(
+            f"\t- Chatroom {room.room_id} "
+            f"- new message #{message.ordinal}: '{message.message}' "
+            f"- {self.get_time()}"
+        )
 
-                    # Implement your agent here #
-                    #
-                    # Extract query from message
-                    query = message.message
-
-                    # Send a message to the corresponding chat room using the post_messages method of the room object.
-                    room.post_messages(f"Received your message!")
-                    # Mark the message as processed, so it will be filtered out when retrieving new messages.
-
-                    if self.is_sparql(query):
-                        respond = self.sparql_query(message.message)
-                        room.post_messages(f"Query answer: '{respond}' ")
-                    else:
-                        try:
-                            respond = self.ec.start(query)
-                            room.post_messages(respond)
-                        except Exception as e:
-                            print(f"Error: {str(e)}")
-                            room.post_messages("Sorry something went wrong '>.<")
-
-                    room.mark_as_processed(message)
-                # Retrieve reactions from this chat room.
-                # If only_new=True, it filters out reactions that have already been marked as processed.
-                for reaction in room.get_reactions(only_new=True):
-                    print(
-                        f"\t- Chatroom {room.room_id} "
-                        f"- new reaction #{reaction.message_ordinal}: '{reaction.type}' "
-                        f"- {self.get_time()}"
-                    )
+        # Implement your agent here #
+        #
+        # Extract query from message
+        query = message.message
+
+        # Send a message to the corresponding chat room using the post_messages method of the room object.
+        room.post_messages(f"Received your message!")
+
+        if self.is_sparql(query):
+            for post in self.sparql_query(message.message):
+                room.post_messages(post)
+        else:
+            try:
+                respond = self.ec.start(query)
+                room.post_messages(respond)
+            except Exception as e:
+                print(f"Error: {str(e)}")
+                room.post_messages("Sorry something went wrong '>.<")
+
+        # Mark the message as processed, so it will be filtered out when retrieving new messages.
+        room.mark_as_processed(message)
+
+    def handle_reaction(self, room: Chatroom, reaction):
+        print(
+            f"\t- Chatroom {room.room_id} "
+            f"- new reaction #{reaction.message_ordinal}: '{reaction.type}' "
+            f"- {self.get_time()}"
+        )
+
+        # Implement your agent here #
+
+        room.post_messages(f"Received your reaction: '{reaction.type}' ")
+        room.mark_as_processed(reaction)
+
+    def welcome(self, room: Chatroom):
+        if not room.initiated:
+            # send a welcome message if room is not initiated
+            room.post_messages(
+                f"Hello! This is a welcome message from {room.my_alias}."
+            )
+            room.initiated = True
 
-                    # Implement your agent here #
+    def listen(self, workers: int = 0):
+        """Answer the new messages and reactions of the active rooms.
 
-                    room.post_messages(f"Received your reaction: '{reaction.type}' ")
-                    room.mark_as_processed(reaction)
+        With `workers` > 0 rooms are answered concurrently on a pool of that
+        many threads, each room keeps its own queue so its replies are still
+        posted in order. With 0 everything is answered in the polling loop.
+        """
+        dispatcher = RoomDispatcher(workers) if workers > 0 else None
+        self.speakeasy.on_room_opened(self.welcome)
+        try:
+            # Only active chatrooms (i.e., remaining_time > 0) are polled, busy ones more
+            # often than idle ones. Messages sent by the current bot are filtered out, the
+            # handlers mark the events as processed once they are answered.
+            for event in self.speakeasy.events(
+                min_interval=listen_freq, max_interval=listen_max_freq, auto_ack=False
+            ):
+                if isinstance(event, MessageEvent):
+                    handler = functools.partial(
+                        self.handle_message, event.room, event.message
+                    )
+                else:
+                    handler = functools.partial(
+                        self.handle_reaction, event.room, event.reaction
+                    )
 
-            time.sleep(listen_freq)
+                if dispatcher is None:
+                    handler()
+                else:
+                    dispatcher.submit(event.room, event.key, handler)
+        finally:
+            if dispatcher is not None:
+                dispatcher.shutdown(wait=False)
 
     @staticmethod
     def get_time():
@@ -138,4 +178,4 @@ class Agent:
 
 if __name__ == "__main__":
     demo_bot = Agent("kindle-pizzicato-wheat_bot", "zJD7llj0A010Zg")
-    demo_bot.listen()
+    demo_bot.listen(listen_workers)
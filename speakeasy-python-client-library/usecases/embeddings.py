@@ -1,8 +1,12 @@
 import numpy as np
-import rdflib, csv
-from sklearn.metrics import pairwise_distances
+import rdflib
+from typing import List, Tuple
 
 import os
+from ann_index import ExactIndex, IVFIndex, squared_norms
+from answer_cache import AnswerCache, PrecomputedAnswers
+from entity_ids import EntityIdTable
+from sidecars import is_fresh, save_atomic, sidecar_path
 
 
 class EmbeddingRelation(object):
@@ -27,8 +31,69 @@ class EmbeddingRelation(object):
         return e
 
 
+def load_embeddings(
+    path: str, mmap_mode: str | None = None, dtype: str | None = None
+) -> np.ndarray:
+    """Load an embedding matrix, optionally memory-mapped and in another dtype.
+
+    A dtype different from the stored one is converted once into a sidecar
+    file (e.g. `entity_embeds.float16.npy`) which is then loaded or mapped
+    like the original, so every worker shares the same converted copy. The
+    sidecar is converted again whenever `path` is newer.
+    """
+    if dtype is not None:
+        dtype = np.dtype(dtype)
+        if np.load(path, mmap_mode="r").dtype != dtype:
+            converted_path = sidecar_path(path, dtype.name)
+            if not is_fresh(converted_path, path):
+                converted = np.load(path, mmap_mode="r").astype(dtype)
+                save_atomic(converted_path, lambda f: np.save(f, converted))
+            path = converted_path
+
+    return np.load(path, mmap_mode=mmap_mode)
+
+
+def load_squared_norms(
+    path: str, vectors: np.ndarray, mmap_mode: str | None = None
+) -> np.ndarray:
+    """Squared row norms of `vectors`, cached next to `path` when mapping so a
+    worker start does not have to read the whole matrix. The cache is rebuilt
+    whenever `path` is newer."""
+    if mmap_mode is None:
+        return squared_norms(vectors)
+
+    norms_path = sidecar_path(path, f"{vectors.dtype.name}.sqnorms")
+    if is_fresh(norms_path, path):
+        norms = np.load(norms_path, mmap_mode=mmap_mode)
+        if norms.shape == vectors.shape[:1]:
+            return norms
+
+    norms = squared_norms(vectors)
+    save_atomic(norms_path, lambda f: np.save(f, norms))
+    return np.load(norms_path, mmap_mode=mmap_mode)
+
+
 class EmbeddingAnswerer(object):
-    def __init__(self):
+    def __init__(
+        self,
+        index: str = "exact",
+        n_probe: int = 8,
+        mmap_mode: str | None = None,
+        dtype: str | None = None,
+        cache_size: int = 4096,
+    ):
+        """`index` selects the tail lookup: "exact" scans every entity, "ivf"
+        uses an approximate inverted-file index persisted next to the entity
+        embeddings, scanning `n_probe` buckets per query.
+
+        `mmap_mode` (e.g. "r") maps the embedding tables instead of reading
+        them, so worker processes share one page-cache copy. `dtype` (e.g.
+        "float16") picks the storage precision, computation stays float32.
+
+        Answers are kept in an LRU of `cache_size` entries and served from
+        `entity_answers.npz` when that precomputed table exists and was
+        computed from the current embeddings and entity ids.
+        """
         # Get the absolute path to the current directory
         current_directory = os.path.dirname(os.path.abspath(__file__))
 
@@ -39,17 +104,56 @@ class EmbeddingAnswerer(object):
         entity_emb_path = os.path.join(data_folder, "entity_embeds.npy")
         relation_emb_path = os.path.join(data_folder, "relation_embeds.npy")
         ent_ids_path = os.path.join(data_folder, "entity_ids.del")
+        ent_ids_table_path = os.path.join(data_folder, "entity_ids.npz")
+        ivf_index_path = os.path.join(data_folder, "entity_embeds.ivf.npz")
+        answers_path = os.path.join(data_folder, "entity_answers.npz")
 
         # load the embeddings
-        self.entity_emb = np.load(entity_emb_path)
-        self.relation_emb = np.load(relation_emb_path)
+        self.entity_emb = load_embeddings(entity_emb_path, mmap_mode, dtype)
+        self.relation_emb = load_embeddings(relation_emb_path, mmap_mode, dtype)
+
+        # entity URI <-> embedding row, cached as a binary sidecar of entity_ids.del
+        self.entity_ids_path = ent_ids_path
+        self.entity_ids = EntityIdTable.load_or_build(ent_ids_path, ent_ids_table_path)
+
+        # squared norm of every entity, so ||e - q||^2 can be expanded into
+        # ||e||^2 - 2 e.q + ||q||^2 with a single matrix-vector product per query
+        self.entity_sq_norms = load_squared_norms(
+            entity_emb_path, self.entity_emb, mmap_mode
+        )
+
+        if index == "ivf":
+            self.index = IVFIndex.load_or_build(
+                ivf_index_path,
+                self.entity_emb,
+                n_probe,
+                self.entity_sq_norms,
+                entity_emb_path,
+            )
+        elif index == "exact":
+            self.index = ExactIndex(self.entity_emb, self.entity_sq_norms)
+        else:
+            raise ValueError(f"Unknown embedding index '{index}'")
+
+        # shapes and modification times of the files answers are derived from,
+        # a precomputed table is only used if it was built from the same ones
+        self.answers_source = np.array(
+            [
+                *self.entity_emb.shape,
+                *self.relation_emb.shape,
+                os.path.getmtime(entity_emb_path),
+                os.path.getmtime(relation_emb_path),
+                os.path.getmtime(ent_ids_path),
+            ],
+            dtype=np.float64,
+        )
 
-        with open(ent_ids_path, "r") as ifile:
-            self.ent2id = {
-                rdflib.term.URIRef(ent): int(idx)
-                for idx, ent in csv.reader(ifile, delimiter="\t")
-            }
-            self.id2ent = {v: k for k, v in self.ent2id.items()}
+        self.answer_cache = AnswerCache(cache_size)
+        self.precomputed_answers = (
+            PrecomputedAnswers.load(answers_path, self.answers_source)
+            if os.path.exists(answers_path)
+            else None
+        )
 
     @staticmethod
     def is_predicate_in_embedding(relation_label: str) -> EmbeddingRelation | None:
@@ -59,22 +163,135 @@ class EmbeddingAnswerer(object):
 
         return None
 
+    def _to_answers(
+        self, ids: np.ndarray, sq_dist: np.ndarray
+    ) -> Tuple[Tuple[rdflib.term.URIRef, float], ...]:
+        # rows without an entity (gaps in entity_ids.del) are no answer
+        uris = [self.entity_ids.uri(idx) for idx in ids]
+        return tuple(
+            (uri, float(np.sqrt(max(d, 0.0))))
+            for uri, d in zip(uris, sq_dist)
+            if uri is not None
+        )
+
+    def _known_answers(self, ent_id: int, relation_key: int, k: int):
+        """Answers from the LRU or the precomputed table, None if neither has them."""
+        key = (ent_id, relation_key, k)
+        answers = self.answer_cache.get(key)
+        if answers is None and self.precomputed_answers is not None:
+            stored = self.precomputed_answers.lookup(ent_id, relation_key, k)
+            if stored is not None:
+                answers = self._to_answers(*stored)
+                self.answer_cache.put(key, answers)
+        return answers
+
+    def top_k(
+        self, subject, relation_key: int, k: int = 1
+    ) -> List[Tuple[rdflib.term.URIRef, float]]:
+        ent_id = self.entity_ids.get(subject)
+        if ent_id is None:
+            return []
+
+        answers = self._known_answers(ent_id, relation_key, k)
+        if answers is None:
+            head = self.entity_emb[ent_id].astype(self.index.dtype)
+            lhs = head + self.relation_emb[relation_key]
+            answers = self._to_answers(*self.index.search(lhs, k))
+            self.answer_cache.put((ent_id, relation_key, k), answers)
+
+        return list(answers)
+
+    def batch_top_k(
+        self, subjects, relation_keys, k: int = 1
+    ) -> List[List[Tuple[rdflib.term.URIRef, float]]]:
+        """`top_k` for many (subject, relation_key) pairs at once.
+
+        Pairs missing from the caches are answered with a single matrix-matrix
+        distance computation, unknown subjects get an empty answer list.
+        """
+        ent_ids = self.entity_ids.rows(subjects)
+        relation_keys = np.asarray(relation_keys, dtype=np.int64)
+        answers = [[] for _ in range(ent_ids.shape[0])]
+
+        missing = []
+        for row in np.flatnonzero(ent_ids >= 0):
+            known = self._known_answers(int(ent_ids[row]), int(relation_keys[row]), k)
+            if known is None:
+                missing.append(row)
+            else:
+                answers[row] = list(known)
+        if not missing:
+            return answers
+
+        missing = np.array(missing, dtype=np.int64)
+        heads = self.entity_emb[ent_ids[missing]].astype(self.index.dtype)
+        lhs = heads + self.relation_emb[relation_keys[missing]]
+        ids, sq_dist = self.index.batch_search(lhs, k)
+
+        for row, row_ids, row_dist in zip(missing, ids, sq_dist):
+            row_answers = self._to_answers(row_ids, row_dist)
+            self.answer_cache.put(
+                (int(ent_ids[row]), int(relation_keys[row]), k), row_answers
+            )
+            answers[row] = list(row_answers)
+        return answers
+
+    def precompute_answers(
+        self, subjects, relation_keys, k: int = 5, batch_size: int = 256
+    ) -> PrecomputedAnswers:
+        """Top-k answers for every subject x relation pair, e.g. all films x
+        `COMMON_FILM_RELATIONS`, as a table that can be saved to
+        `entity_answers.npz`."""
+        ent_ids = self.entity_ids.rows(subjects)
+        ent_ids = np.unique(ent_ids[ent_ids >= 0])
+        relation_keys = np.unique(np.asarray(relation_keys, dtype=np.int64))
+        pair_ents = np.repeat(ent_ids, relation_keys.shape[0])
+        pair_relations = np.tile(relation_keys, ent_ids.shape[0])
+
+        k = min(k, self.entity_emb.shape[0])
+        ids = np.empty((pair_ents.shape[0], k), dtype=np.int32)
+        dists = np.empty((pair_ents.shape[0], k), dtype=np.float32)
+        for start in range(0, pair_ents.shape[0], batch_size):
+            stop = start + batch_size
+            heads = self.entity_emb[pair_ents[start:stop]].astype(self.index.dtype)
+            lhs = heads + self.relation_emb[pair_relations[start:stop]]
+            ids[start:stop], dists[start:stop] = self.index.batch_search(lhs, k)
+
+        return PrecomputedAnswers.from_answers(
+            pair_ents, pair_relations, ids, dists, self.answers_source
+        )
+
     def calculate_embedding_node(
         self, subject, relation_key: int
     ) -> rdflib.IdentifiedNode | None:
-        ent_id = self.ent2id.get(subject)
-        pred = self.relation_emb[relation_key]
-        head = self.entity_emb[ent_id]
-
-        lhs = head + pred
-        # compute distance to *any* entity
-        dist = pairwise_distances(lhs.reshape(1, -1), self.entity_emb).reshape(-1)
-        # find most plausible entities
-        most_likely = dist.argsort()
-        en = self.id2ent[most_likely[0]]
+        best = self.top_k(subject, relation_key, k=1)
+        return best[0][0] if best else None
 
-        return en
 
+# relations users ask about most, precomputed for every film by
+# data/precompute_answers.py
+COMMON_FILM_RELATIONS = [
+    "director",
+    "cast member",
+    "genre",
+    "screenwriter",
+    "director of photography",
+    "film editor",
+    "production company",
+    "distributed by",
+    "country of origin",
+    "original language of film or TV show",
+    "executive producer",
+    "award received",
+    "nominated for",
+    "filming location",
+    "narrative location",
+    "based on",
+    "main subject",
+    "MPAA film rating",
+    "follows",
+    "followed by",
+]
 
 LABELS_IN_RELATION_IDS_DEL = {
     "cast member": 0,
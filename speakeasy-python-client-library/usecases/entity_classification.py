@@ -12,12 +12,16 @@ class EntryClassifier:
         # Initialize components
         self.entity_recognizer = EntityRecognizer()
         self.embedding_answerer = embeddings.EmbeddingAnswerer()
-        self.graph = Graph(
-            os.path.join(
-                os.path.dirname(os.path.abspath(__file__)),
-                "data",
-                "pickle_graph.pickel",
-            )
+        data_folder = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+        # prefer the memory-mapped store from data/dump_graph_store.py if present
+        graph_path = os.path.join(data_folder, "graph_store")
+        if not os.path.isdir(graph_path):
+            graph_path = os.path.join(data_folder, "pickle_graph.pickel")
+        self.graph = Graph(graph_path)
+        self.graph.use_label_table(
+            os.path.join(data_folder, "entity_labels.npz"),
+            self.embedding_answerer.entity_ids,
+            self.embedding_answerer.entity_ids_path,
         )
         self.embedding_recognizer = embeddings_rec.EmbeddingRecognizer()
 
@@ -51,5 +55,7 @@ class EntryClassifier:
             entity, relation.relation_key
         )
 
-        answer_label = self.graph.entity_to_label(answer_entity)
-        return "I think you are looking for {}".format(answer_label.toPython())
+        answer_label = self.graph.entities_to_labels([answer_entity])[0]
+        if answer_label is None:
+            return "Sorry, I could not find an answer to that."
+        return "I think you are looking for {}".format(answer_label)
@@ -0,0 +1,224 @@
+import os
+import numpy as np
+import rdflib
+from typing import Callable, Iterable, List
+
+from sidecars import is_fresh, save_atomic
+
+WD_ENTITY_PREFIX = "http://www.wikidata.org/entity/Q"
+
+# marks rows whose entity is not a plain Wikidata Q-number
+_NOT_Q = -1
+
+
+def _q_number(uri: str) -> int:
+    if uri.startswith(WD_ENTITY_PREFIX):
+        number = uri[len(WD_ENTITY_PREFIX) :]
+        # leading zeros would not survive the round trip through an int
+        if number.isdigit() and not number.startswith("0"):
+            return int(number)
+    return _NOT_Q
+
+
+class EntityIdTable(object):
+    """Array-backed mapping between entity URIs and embedding row ids.
+
+    Wikidata entities are stored as prefix-stripped Q-numbers, one int64 per
+    row, with a sorted copy for binary search in the other direction. The
+    few entities outside that namespace are kept in a small dict.
+    """
+
+    def __init__(
+        self,
+        row_q: np.ndarray,
+        other_uris: np.ndarray,
+        other_rows: np.ndarray,
+    ):
+        # Q-number of every embedding row, _NOT_Q for rows in `other_uris`
+        self.row_q = row_q
+        self._sorted_rows = np.argsort(row_q, kind="stable")
+        self._sorted_q = row_q[self._sorted_rows]
+        self.other_uris = other_uris
+        self.other_rows = other_rows
+        self._other_ids = {
+            str(uri): int(row) for uri, row in zip(other_uris, other_rows)
+        }
+        self._other_uris_by_row = {row: uri for uri, row in self._other_ids.items()}
+
+    def __len__(self) -> int:
+        return self.row_q.shape[0]
+
+    def __contains__(self, uri) -> bool:
+        return self.get(uri) is not None
+
+    @classmethod
+    def from_del(cls, path: str) -> "EntityIdTable":
+        """Parse a tab separated `row<TAB>uri` file such as `entity_ids.del`."""
+        rows, q_numbers = [], []
+        other_uris, other_rows = [], []
+        with open(path, "r") as ifile:
+            for line in ifile:
+                line = line.rstrip("\n")
+                if not line:
+                    continue
+                idx, uri = line.split("\t", 1)
+                q = _q_number(uri)
+                rows.append(int(idx))
+                q_numbers.append(q)
+                if q == _NOT_Q:
+                    other_uris.append(uri)
+                    other_rows.append(int(idx))
+
+        row_q = np.full(max(rows, default=-1) + 1, _NOT_Q, dtype=np.int64)
+        row_q[np.array(rows, dtype=np.int64)] = np.array(q_numbers, dtype=np.int64)
+        return cls(
+            row_q, np.array(other_uris, dtype=str), np.array(other_rows, dtype=np.int64)
+        )
+
+    def save(self, path: str):
+        save_atomic(
+            path,
+            lambda f: np.savez(
+                f,
+                row_q=self.row_q,
+                other_uris=self.other_uris,
+                other_rows=self.other_rows,
+            ),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EntityIdTable":
+        with np.load(path) as data:
+            return cls(data["row_q"], data["other_uris"], data["other_rows"])
+
+    @classmethod
+    def load_or_build(cls, del_path: str, sidecar_path: str) -> "EntityIdTable":
+        """Load the binary sidecar, (re)building it when `del_path` is newer."""
+        if is_fresh(sidecar_path, del_path):
+            return cls.load(sidecar_path)
+
+        table = cls.from_del(del_path)
+        table.save(sidecar_path)
+        return table
+
+    def _row_of_q(self, q: int) -> int | None:
+        pos = np.searchsorted(self._sorted_q, q)
+        if pos < self._sorted_q.shape[0] and self._sorted_q[pos] == q:
+            return int(self._sorted_rows[pos])
+        return None
+
+    def get(self, uri, default=None) -> int | None:
+        """Embedding row of `uri`, or `default` if the entity is unknown."""
+        if uri is None:
+            return default
+        uri = str(uri)
+        q = _q_number(uri)
+        row = self._other_ids.get(uri) if q == _NOT_Q else self._row_of_q(q)
+        return default if row is None else row
+
+    def rows(self, uris: Iterable) -> np.ndarray:
+        """Embedding rows of many entities at once, -1 for unknown ones."""
+        uris = [str(uri) for uri in uris]
+        q = np.array([_q_number(uri) for uri in uris], dtype=np.int64)
+        is_q = q != _NOT_Q
+
+        rows = np.full(len(uris), -1, dtype=np.int64)
+        if self._sorted_q.shape[0]:
+            pos = np.searchsorted(self._sorted_q, q)
+            pos = np.minimum(pos, self._sorted_q.shape[0] - 1)
+            hit = is_q & (self._sorted_q[pos] == q)
+            rows[hit] = self._sorted_rows[pos[hit]]
+        for i in np.flatnonzero(~is_q):
+            rows[i] = self._other_ids.get(uris[i], -1)
+        return rows
+
+    def assigned_rows(self) -> np.ndarray:
+        """Rows that have an entity, entity_ids.del may leave gaps."""
+        return np.sort(
+            np.concatenate((np.flatnonzero(self.row_q != _NOT_Q), self.other_rows))
+        )
+
+    def uri(self, row: int) -> rdflib.term.URIRef | None:
+        """Entity of `row`, None for the gaps entity_ids.del may leave."""
+        q = int(self.row_q[row])
+        if q == _NOT_Q:
+            uri = self._other_uris_by_row.get(int(row))
+            return None if uri is None else rdflib.term.URIRef(uri)
+        return rdflib.term.URIRef(f"{WD_ENTITY_PREFIX}{q}")
+
+
+class EntityLabelTable(object):
+    """Labels aligned with the embedding rows of an `EntityIdTable`.
+
+    Stored as one UTF-8 blob with offsets and kept in memory as an object
+    array, so labelling a ranked answer list is a single gather.
+    """
+
+    def __init__(self, labels: np.ndarray):
+        # label of every embedding row, None if the entity has none
+        self.labels = labels
+
+    def __len__(self) -> int:
+        return self.labels.shape[0]
+
+    @classmethod
+    def build(cls, entity_ids: EntityIdTable, label_of: Callable) -> "EntityLabelTable":
+        """`label_of(uri)` gives the label of one entity, e.g.
+        `Graph.entity_to_label`."""
+        labels = np.empty(len(entity_ids), dtype=object)
+        for row in entity_ids.assigned_rows():
+            label = label_of(entity_ids.uri(row))
+            labels[row] = None if label is None else str(label)
+        return cls(labels)
+
+    def save(self, path: str):
+        has_label = np.array([label is not None for label in self.labels], dtype=bool)
+        encoded = [(label or "").encode("utf-8") for label in self.labels]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        save_atomic(
+            path,
+            lambda f: np.savez(f, blob=blob, offsets=offsets, has_label=has_label),
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "EntityLabelTable":
+        with np.load(path) as data:
+            blob = data["blob"].tobytes()
+            offsets, has_label = data["offsets"], data["has_label"]
+        labels = np.empty(has_label.shape[0], dtype=object)
+        for row in np.flatnonzero(has_label):
+            labels[row] = blob[offsets[row] : offsets[row + 1]].decode("utf-8")
+        return cls(labels)
+
+    @classmethod
+    def load_or_build(
+        cls,
+        path: str,
+        entity_ids: EntityIdTable,
+        label_of: Callable,
+        source_paths: Iterable[str] = (),
+    ) -> "EntityLabelTable":
+        """Load the table stored at `path`, (re)building it when any of
+        `source_paths` (e.g. entity_ids.del and the graph) is newer."""
+        if os.path.exists(path) and all(
+            is_fresh(path, source) for source in source_paths
+        ):
+            table = cls.load(path)
+            if len(table) == len(entity_ids):
+                return table
+
+        table = cls.build(entity_ids, label_of)
+        table.save(path)
+        return table
+
+    def labels_of_rows(self, rows: np.ndarray) -> np.ndarray:
+        rows = np.asarray(rows, dtype=np.int64)
+        labels = np.empty(rows.shape[0], dtype=object)
+        valid = (rows >= 0) & (rows < len(self))
+        labels[valid] = self.labels[rows[valid]]
+        return labels
+
+    def labels_of(self, uris: Iterable, entity_ids: EntityIdTable) -> List[str | None]:
+        return self.labels_of_rows(entity_ids.rows(uris)).tolist()
@@ -0,0 +1,216 @@
+import os
+import numpy as np
+import rdflib
+from rdflib.plugins.parsers.ntriples import W3CNTriplesParser
+from rdflib.term import BNode, Literal, Node, URIRef
+from typing import Iterator, Tuple
+
+# separates value, language and datatype of an encoded literal
+_SEP = "\x00"
+
+_ARRAYS = ("term_offsets", "spo_s", "spo_p", "spo_o", "pos_p", "pos_o", "pos_s")
+
+
+def encode_term(term: Node) -> bytes:
+    """Stable byte encoding of a term, terms are sorted by these bytes."""
+    if isinstance(term, URIRef):
+        key = "U" + term
+    elif isinstance(term, Literal):
+        key = "L" + _SEP.join((str(term), term.language or "", term.datatype or ""))
+    elif isinstance(term, BNode):
+        key = "B" + term
+    else:
+        raise TypeError(f"Cannot encode term {term!r}")
+    return key.encode("utf-8")
+
+
+def decode_term(data: bytes) -> Node:
+    key = data.decode("utf-8")
+    kind, value = key[0], key[1:]
+    if kind == "U":
+        return URIRef(value)
+    if kind == "B":
+        return BNode(value)
+    value, language, datatype = value.rsplit(_SEP, 2)
+    return Literal(value, lang=language or None, datatype=datatype or None)
+
+
+class _TripleCollector(object):
+    """N-Triples parser sink assigning provisional ids in first-seen order."""
+
+    def __init__(self):
+        self.term_ids = {}
+        self.triples = []
+
+    def _id(self, term: Node) -> int:
+        key = encode_term(term)
+        term_id = self.term_ids.get(key)
+        if term_id is None:
+            term_id = self.term_ids[key] = len(self.term_ids)
+        return term_id
+
+    def triple(self, s: Node, p: Node, o: Node):
+        self.triples.append((self._id(s), self._id(p), self._id(o)))
+
+
+class TripleStore(object):
+    """Read-only, integer-encoded triple store backed by plain .npy files.
+
+    Every term gets an id in byte order of its encoding, so term -> id is a
+    binary search over the term blob. Triples are kept twice as sorted
+    columns, (s, p, o) for `objects` and (p, o, s) for `subjects`, all of
+    which can be memory-mapped.
+    """
+
+    def __init__(
+        self,
+        term_blob: np.ndarray,
+        term_offsets: np.ndarray,
+        spo: Tuple[np.ndarray, np.ndarray, np.ndarray],
+        pos: Tuple[np.ndarray, np.ndarray, np.ndarray],
+    ):
+        # term i is term_blob[term_offsets[i]:term_offsets[i + 1]]
+        self.term_blob = term_blob
+        self.term_offsets = term_offsets
+        self.spo_s, self.spo_p, self.spo_o = spo
+        self.pos_p, self.pos_o, self.pos_s = pos
+
+    def __len__(self) -> int:
+        return self.spo_s.shape[0]
+
+    @property
+    def n_terms(self) -> int:
+        return self.term_offsets.shape[0] - 1
+
+    @classmethod
+    def from_triples(cls, triples: Iterator[Tuple[Node, Node, Node]]) -> "TripleStore":
+        collector = _TripleCollector()
+        for s, p, o in triples:
+            collector.triple(s, p, o)
+        return cls._from_collector(collector)
+
+    @classmethod
+    def from_nt(cls, nt_path: str) -> "TripleStore":
+        """Stream an N-Triples file without building an rdflib graph."""
+        collector = _TripleCollector()
+        with open(nt_path, "rb") as ifile:
+            W3CNTriplesParser(collector).parse(ifile)
+        return cls._from_collector(collector)
+
+    @classmethod
+    def _from_collector(cls, collector: _TripleCollector) -> "TripleStore":
+        keys = list(collector.term_ids.keys())
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        id_dtype = np.int32 if len(keys) < np.iinfo(np.int32).max else np.int64
+
+        # provisional id -> final (sorted) id
+        remap = np.empty(len(keys), dtype=id_dtype)
+        remap[np.array(order, dtype=np.int64)] = np.arange(len(keys), dtype=id_dtype)
+
+        sorted_keys = [keys[i] for i in order]
+        term_offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(k) for k in sorted_keys], out=term_offsets[1:])
+        term_blob = np.frombuffer(b"".join(sorted_keys), dtype=np.uint8)
+
+        triples = remap[np.array(collector.triples, dtype=np.int64).reshape(-1, 3)]
+        triples = np.unique(triples, axis=0)
+        s, p, o = triples[:, 0], triples[:, 1], triples[:, 2]
+        pos_order = np.lexsort((s, o, p))
+
+        return cls(
+            term_blob,
+            term_offsets,
+            (np.ascontiguousarray(s), np.ascontiguousarray(p), np.ascontiguousarray(o)),
+            (p[pos_order], o[pos_order], s[pos_order]),
+        )
+
+    def save(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        np.save(os.path.join(directory, "term_blob.npy"), self.term_blob)
+        for name in _ARRAYS:
+            np.save(os.path.join(directory, f"{name}.npy"), getattr(self, name))
+
+    @classmethod
+    def load(cls, directory: str, mmap_mode: str | None = "r") -> "TripleStore":
+        def _load(name):
+            return np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+
+        return cls(
+            _load("term_blob"),
+            _load("term_offsets"),
+            (_load("spo_s"), _load("spo_p"), _load("spo_o")),
+            (_load("pos_p"), _load("pos_o"), _load("pos_s")),
+        )
+
+    @staticmethod
+    def is_store(path: str) -> bool:
+        return os.path.isdir(path) and os.path.exists(
+            os.path.join(path, "term_blob.npy")
+        )
+
+    def _encoded(self, term_id: int) -> bytes:
+        start, end = self.term_offsets[term_id], self.term_offsets[term_id + 1]
+        return self.term_blob[start:end].tobytes()
+
+    def term(self, term_id: int) -> Node:
+        return decode_term(self._encoded(int(term_id)))
+
+    def term_id(self, term: Node) -> int | None:
+        key = encode_term(term)
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._encoded(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._encoded(lo) == key:
+            return lo
+        return None
+
+    @staticmethod
+    def _range(column: np.ndarray, value: int, lo: int, hi: int) -> Tuple[int, int]:
+        part = column[lo:hi]
+        return (
+            lo + int(np.searchsorted(part, value, "left")),
+            lo + int(np.searchsorted(part, value, "right")),
+        )
+
+    def object_ids(self, s_id: int, p_id: int) -> np.ndarray:
+        lo, hi = self._range(self.spo_s, s_id, 0, len(self))
+        lo, hi = self._range(self.spo_p, p_id, lo, hi)
+        return self.spo_o[lo:hi]
+
+    def subject_ids(self, p_id: int, o_id: int) -> np.ndarray:
+        lo, hi = self._range(self.pos_p, p_id, 0, len(self))
+        lo, hi = self._range(self.pos_o, o_id, lo, hi)
+        return self.pos_s[lo:hi]
+
+    def predicate_pairs(self, p_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """(subject ids, object ids) of every triple with predicate `p_id`."""
+        lo, hi = self._range(self.pos_p, p_id, 0, len(self))
+        return self.pos_s[lo:hi], self.pos_o[lo:hi]
+
+    def objects(self, subject: Node, predicate: Node) -> Iterator[Node]:
+        s_id, p_id = self.term_id(subject), self.term_id(predicate)
+        if s_id is None or p_id is None:
+            return
+        for o_id in self.object_ids(s_id, p_id):
+            yield self.term(o_id)
+
+    def subjects(self, predicate: Node, obj: Node) -> Iterator[Node]:
+        p_id, o_id = self.term_id(predicate), self.term_id(obj)
+        if p_id is None or o_id is None:
+            return
+        for s_id in self.subject_ids(p_id, o_id):
+            yield self.term(s_id)
+
+    def triples(self) -> Iterator[Tuple[Node, Node, Node]]:
+        for s_id, p_id, o_id in zip(self.spo_s, self.spo_p, self.spo_o):
+            yield self.term(s_id), self.term(p_id), self.term(o_id)
+
+    def to_rdflib(self) -> rdflib.Graph:
+        """Materialise an rdflib graph, only needed for free-form SPARQL."""
+        g = rdflib.Graph()
+        g.addN((s, p, o, g) for s, p, o in self.triples())
+        return g
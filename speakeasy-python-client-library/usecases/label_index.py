@@ -0,0 +1,171 @@
+import bisect
+import re
+import numpy as np
+from typing import Dict, Iterable, List, Set, Tuple
+
+from rdflib.term import IdentifiedNode, Literal
+
+import utils
+from ann_index import select_top_k
+
+_DASHES = re.compile(r"[\u2010-\u2015\u2212-]")
+_SPACES = re.compile(r"\s+")
+_TOKEN_SPLIT = re.compile(r"\W+")
+
+
+def normalise_label(label: str) -> str:
+    """Lower-cased label without sentence endings, with a single kind of dash
+    and single spaces, so NER spans and graph labels compare equal."""
+    label = utils.lower_remove_sent_endings_at_end(str(label))
+    label = _DASHES.sub("-", label)
+    return _SPACES.sub(" ", label).strip()
+
+
+def tokenize(normalised: str) -> List[str]:
+    return [t for t in _TOKEN_SPLIT.split(normalised) if t]
+
+
+def trigrams(normalised: str) -> Set[str]:
+    """Character trigrams of the tokens, padded so word starts weigh more."""
+    padded = "  " + " ".join(tokenize(normalised)) + " "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+class TrigramIndex(object):
+    """Character-trigram inverted index scoring strings by Jaccard similarity.
+
+    Postings are int32 arrays of string ids, a query counts shared trigrams
+    with one `bincount` over the postings of its own trigrams.
+    """
+
+    def __init__(self, strings: List[str]):
+        self.strings = strings
+        postings: Dict[str, List[int]] = {}
+        sizes = np.empty(len(strings), dtype=np.int32)
+        for string_id, string in enumerate(strings):
+            grams = trigrams(string)
+            sizes[string_id] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(string_id)
+
+        self._sizes = sizes
+        self._postings = {
+            gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()
+        }
+
+    def search(
+        self, query: str, k: int = 5, min_score: float = 0.0
+    ) -> List[Tuple[str, float]]:
+        grams = trigrams(query)
+        hits = [self._postings[g] for g in grams if g in self._postings]
+        if not hits:
+            return []
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.strings))
+        scores = shared / (len(grams) + self._sizes - shared)
+        return [
+            (self.strings[i], float(scores[i]))
+            for i in select_top_k(-scores, k)
+            if scores[i] > 0 and scores[i] >= min_score
+        ]
+
+
+class FilmLabelIndex(object):
+    """In-memory index from normalised film labels to (film, label) pairs.
+
+    `lookup` returns every label containing the name, exact matches first,
+    then whole-word and prefix matches. Containment is answered from a token
+    inverted index, only candidate labels are compared as strings.
+    `fuzzy_lookup` tolerates typos and punctuation through trigram similarity.
+    """
+
+    def __init__(self, films_with_labels: Iterable[Tuple[IdentifiedNode, Literal]]):
+        self._films: Dict[str, List[Tuple[IdentifiedNode, Literal]]] = {}
+        for film, label in films_with_labels:
+            self._films.setdefault(normalise_label(label), []).append((film, label))
+
+        self._labels = sorted(self._films)
+        self._postings: Dict[str, Set[str]] = {}
+        for label in self._labels:
+            for token in tokenize(label):
+                self._postings.setdefault(token, set()).add(label)
+        self._tokens = sorted(self._postings)
+        self._trigrams = TrigramIndex(self._labels)
+
+    def __len__(self) -> int:
+        return len(self._labels)
+
+    def exact(self, name: str) -> List[Tuple[IdentifiedNode, Literal]]:
+        return list(self._films.get(normalise_label(name), []))
+
+    def _labels_with_prefix(self, prefix: str) -> List[str]:
+        start = bisect.bisect_left(self._labels, prefix)
+        end = bisect.bisect_left(self._labels, prefix + "\U0010ffff")
+        return self._labels[start:end]
+
+    def _labels_with_token_prefix(self, prefix: str) -> Set[str]:
+        start = bisect.bisect_left(self._tokens, prefix)
+        end = bisect.bisect_left(self._tokens, prefix + "\U0010ffff")
+        labels = set()
+        for token in self._tokens[start:end]:
+            labels |= self._postings[token]
+        return labels
+
+    def _candidate_labels(self, tokens: List[str]) -> Set[str]:
+        """Superset of the labels that contain the tokens as a substring.
+
+        Inner tokens of the name must be whole label tokens and the last one
+        must start a label token. A single token may sit anywhere inside a
+        label token, so the token vocabulary is scanned instead.
+        """
+        if len(tokens) == 1:
+            labels = set()
+            for token in self._tokens:
+                if tokens[0] in token:
+                    labels |= self._postings[token]
+            return labels
+
+        labels = self._labels_with_token_prefix(tokens[-1])
+        for token in tokens[1:-1]:
+            labels &= self._postings.get(token, set())
+        return labels
+
+    def lookup(
+        self, name: str, limit: int = 10
+    ) -> List[Tuple[IdentifiedNode, Literal]]:
+        name = normalise_label(name)
+        tokens = tokenize(name)
+        if not tokens:
+            return []
+
+        prefixed = set(self._labels_with_prefix(name))
+        contained = {label for label in self._candidate_labels(tokens) if name in label}
+        whole_word = re.compile(rf"(?<!\w){re.escape(name)}(?!\w)")
+
+        def rank(label: str):
+            # exact, then whole-word, then prefix matches, shortest label first
+            return (
+                label != name,
+                whole_word.search(label) is None,
+                label not in prefixed,
+                len(label),
+                label,
+            )
+
+        ranked = sorted(prefixed | contained, key=rank)
+
+        matches = []
+        for label in ranked:
+            matches.extend(self._films[label])
+            if len(matches) >= limit:
+                break
+        return matches[:limit]
+
+    def fuzzy_lookup(
+        self, name: str, k: int = 5, min_score: float = 0.3
+    ) -> List[Tuple[IdentifiedNode, Literal, float]]:
+        """(film, label, similarity) of the k labels most similar to the name."""
+        matches = []
+        for label, score in self._trigrams.search(normalise_label(name), k, min_score):
+            matches.extend((film, org, score) for film, org in self._films[label])
+        return matches[:k]
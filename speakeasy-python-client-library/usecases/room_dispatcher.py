@@ -0,0 +1,63 @@
+import logging
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Deque, Dict, Hashable, Set, Tuple
+
+from speakeasypy import Chatroom
+
+
+class RoomDispatcher(object):
+    """Handles chat items of many rooms on a bounded thread pool.
+
+    Every room has its own FIFO queue and at most one pool task working on
+    it, so items of one room are handled (and their replies posted) in order
+    while a slow answer in one room no longer delays the others.
+    """
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="room"
+        )
+        self._lock = threading.Lock()
+        self._queues: Dict[str, Deque[Tuple[Hashable, Callable[[], None]]]] = {}
+        self._draining: Set[str] = set()
+        # keys of queued or running items, the listen loop sees an item again
+        # on every poll until its handler marks it as processed
+        self._pending: Set[Tuple[str, Hashable]] = set()
+
+    def submit(self, room: Chatroom, key: Hashable, handler: Callable[[], None]):
+        """Queue `handler` for `room` unless an item with `key` is pending."""
+        with self._lock:
+            if (room.room_id, key) in self._pending:
+                return
+            self._pending.add((room.room_id, key))
+            self._queues.setdefault(room.room_id, deque()).append((key, handler))
+            if room.room_id in self._draining:
+                return
+            self._draining.add(room.room_id)
+        self._executor.submit(self._drain, room.room_id)
+
+    def _drain(self, room_id: str):
+        # one item per pool task, the room is re-queued behind the other
+        # rooms' tasks so a busy room cannot starve the rest
+        with self._lock:
+            key, handler = self._queues[room_id].popleft()
+
+        try:
+            handler()
+        except Exception as e:
+            logging.error(
+                f"An error occurred while handling {key} in room {room_id}: {e}"
+            )
+
+        with self._lock:
+            self._pending.discard((room_id, key))
+            if not self._queues[room_id]:
+                del self._queues[room_id]
+                self._draining.discard(room_id)
+                return
+        self._executor.submit(self._drain, room_id)
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
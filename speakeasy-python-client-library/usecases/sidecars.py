@@ -0,0 +1,33 @@
+import os
+import threading
+from typing import BinaryIO, Callable
+
+
+def sidecar_path(path: str, suffix: str) -> str:
+    """`data/entity_embeds.npy` -> `data/entity_embeds.<suffix>.npy`"""
+    root, ext = os.path.splitext(path)
+    return f"{root}.{suffix}{ext}"
+
+
+def is_fresh(path: str, source_path: str) -> bool:
+    """Whether the sidecar at `path` was written after `source_path` last
+    changed, e.g. not before retrained embeddings were dropped in."""
+    return os.path.exists(path) and os.path.getmtime(path) >= os.path.getmtime(
+        source_path
+    )
+
+
+def save_atomic(path: str, write: Callable[[BinaryIO], None]):
+    """Write a sidecar with `write(file)`, e.g. `lambda f: np.savez(f, ...)`.
+
+    Several workers may race to create the same sidecar, so it is written to
+    a temporary file and renamed into place, readers only ever see whole files.
+    """
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        with open(tmp_path, "wb") as ofile:
+            write(ofile)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
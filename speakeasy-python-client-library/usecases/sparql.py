@@ -0,0 +1,310 @@
+import itertools
+import multiprocessing
+import os
+import re
+import signal
+import threading
+from multiprocessing.connection import Connection
+from multiprocessing.reduction import recv_handle, send_handle
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+from rdflib.plugins.sparql import prepareQuery
+from rdflib.term import Literal
+from rdflib.plugins.sparql.sparql import Query
+
+from Graph import Graph
+from answer_cache import AnswerCache
+
+# string literals and IRIs are kept verbatim when normalising query text
+_VERBATIM = re.compile(r"(\"(?:[^\"\\]|\\.)*\"|'(?:[^'\\]|\\.)*'|<[^<>\s]*>)")
+_COMMENT = re.compile(r"#[^\n]*")
+_SPACES = re.compile(r"\s+")
+
+
+def normalise_query(query: str) -> str:
+    """Drop comments and collapse whitespace outside literals and IRIs so
+    equal queries share a key."""
+    parts = _VERBATIM.split(query)
+    # odd parts are the verbatim matches of the capturing group
+    return "".join(
+        part if i % 2 else _SPACES.sub(" ", _COMMENT.sub(" ", part))
+        for i, part in enumerate(parts)
+    ).strip()
+
+
+def format_term(term) -> str:
+    if term is None:
+        return "None"
+    if isinstance(term, Literal):
+        return str(term.toPython())
+    return str(term)
+
+
+def format_rows(rows: Iterable, max_rows: int | None = None) -> Iterator[str]:
+    """One line per result row, values separated by commas. Rows are consumed
+    lazily and at most `max_rows` of them are formatted."""
+    for row in itertools.islice(rows, max_rows):
+        if isinstance(row, tuple):
+            yield ", ".join(format_term(term) for term in row)
+        else:
+            # ASK answers are a single bool
+            yield format_term(row)
+
+
+def chunk_lines(lines: Iterable[str], max_length: int) -> Iterator[str]:
+    """Pack lines into messages of at most `max_length` characters, lines
+    longer than that are split."""
+    chunk = ""
+    for line in lines:
+        while len(line) > max_length:
+            if chunk:
+                yield chunk
+                chunk = ""
+            yield line[:max_length]
+            line = line[max_length:]
+        if chunk and len(chunk) + 1 + len(line) > max_length:
+            yield chunk
+            chunk = ""
+        chunk = f"{chunk}\n{line}" if chunk else line
+    if chunk:
+        yield chunk
+
+
+class SparqlCache(object):
+    """Prepared-query and result caches in front of `Graph.g.query`.
+
+    Queries are keyed on their normalised text. Prepared (parsed and
+    algebra-translated) queries are always reused, results only for result
+    sets of at most `max_cached_rows` rows and until `invalidate` is called.
+    """
+
+    def __init__(
+        self,
+        graph: Graph,
+        max_prepared: int = 256,
+        max_results: int = 256,
+        max_cached_rows: int = 1000,
+    ):
+        self.graph = graph
+        self.max_cached_rows = max_cached_rows
+        self._prepared = AnswerCache(max_prepared)
+        self._results = AnswerCache(max_results)
+
+    def prepare(self, query: str) -> Query:
+        key = normalise_query(query)
+        prepared = self._prepared.get(key)
+        if prepared is None:
+            prepared = prepareQuery(key, initNs=dict(self.graph.g.namespaces()))
+            self._prepared.put(key, prepared)
+        return prepared
+
+    def rows(self, query: str, max_rows: int | None = None) -> Tuple[List, bool]:
+        """At most `max_rows` result rows and whether more were available.
+
+        SELECT results are consumed lazily, so a row limit also stops the
+        evaluation early for queries without ORDER BY or DISTINCT.
+        """
+        key = normalise_query(query)
+        rows = self._results.get(key)
+        if rows is None:
+            limit = None if max_rows is None else max_rows + 1
+            result = self.graph.g.query(self.prepare(key))
+            rows = list(itertools.islice(result, limit))
+            complete = limit is None or len(rows) < limit
+            if complete and len(rows) <= self.max_cached_rows:
+                self._results.put(key, rows)
+
+        if max_rows is not None and len(rows) > max_rows:
+            return rows[:max_rows], True
+        return rows, False
+
+    def query(self, query: str) -> List:
+        return self.rows(query)[0]
+
+    def invalidate(self):
+        """Drop cached results, call whenever the graph changes."""
+        self._results.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "prepared_hits": self._prepared.hits,
+            "prepared_misses": self._prepared.misses,
+            "result_hits": self._results.hits,
+            "result_misses": self._results.misses,
+        }
+
+
+class SparqlTimeout(Exception):
+    pass
+
+
+class SparqlError(Exception):
+    pass
+
+
+def _serve(cache: SparqlCache, conn):
+    """Worker loop: answer ("query", text, max_rows), ("stats",) and
+    ("invalidate",) requests."""
+    while True:
+        try:
+            request = conn.recv()
+        except EOFError:
+            return
+
+        try:
+            if request[0] == "stats":
+                conn.send(("ok", cache.stats()))
+                continue
+            if request[0] == "invalidate":
+                cache.invalidate()
+                conn.send(("ok", None))
+                continue
+            rows, truncated = cache.rows(request[1], request[2])
+            # ResultRow does not pickle, plain tuples do
+            rows = [tuple(row) if isinstance(row, tuple) else row for row in rows]
+            conn.send(("ok", (rows, truncated)))
+        except Exception as e:
+            conn.send(("error", str(e)))
+
+
+def _zygote(cache: SparqlCache, conn, parent_conn, parent_pid: int):
+    """Fork a query worker per request and pass its pid and pipe end back.
+
+    Runs single-threaded, so workers never inherit a lock held by a thread
+    of the bot, and with the graph loaded, so a worker starts right away.
+    """
+    # the inherited parent end would keep the pipe open after the parent exits
+    parent_conn.close()
+    # materialise a lazily built rdflib graph (e.g. from a TripleStore) here,
+    # so only the zygote and its workers hold the rdflib copy
+    cache.graph.g
+    while True:
+        try:
+            conn.recv()
+        except EOFError:
+            return
+
+        # reap the workers killed since the last request
+        try:
+            while os.waitpid(-1, os.WNOHANG)[0]:
+                pass
+        except ChildProcessError:
+            pass
+
+        parent_end, child_end = multiprocessing.Pipe()
+        pid = os.fork()
+        if pid == 0:
+            conn.close()
+            parent_end.close()
+            try:
+                _serve(cache, child_end)
+            finally:
+                os._exit(0)
+
+        child_end.close()
+        conn.send(pid)
+        send_handle(conn, parent_end.fileno(), parent_pid)
+        parent_end.close()
+
+
+class GuardedSparql(object):
+    """Runs `SparqlCache` queries in a forked worker process under a budget.
+
+    A query that exceeds `timeout` seconds gets its worker killed and a fresh
+    one is forked. Results are cut off after `max_rows` rows. Queries are
+    serialised, one at a time.
+
+    The prepared-query and result caches live in the worker, so they start
+    empty with every new worker, i.e. also after a timeout. Use `invalidate`
+    rather than `cache.invalidate`, which only clears this process' copy.
+
+    Workers are not forked from this (by then multi-threaded) process but
+    from a zygote process forked in the constructor, which also materialises
+    the rdflib graph, so this process never holds a copy of it. Create it
+    before starting any threads, e.g. the listener's worker pool or the
+    message sender.
+    """
+
+    def __init__(self, cache: SparqlCache, timeout: float = 10, max_rows: int = 100):
+        self.cache = cache
+        self.timeout = timeout
+        self.max_rows = max_rows
+        # fork shares the loaded graph copy-on-write instead of reloading it
+        self._ctx = multiprocessing.get_context("fork")
+        self._lock = threading.Lock()
+        self._pid = None
+        self._conn = None
+
+        self._zygote_conn, child_conn = self._ctx.Pipe()
+        self._zygote = self._ctx.Process(
+            target=_zygote,
+            args=(cache, child_conn, self._zygote_conn, os.getpid()),
+            daemon=True,
+        )
+        self._zygote.start()
+        child_conn.close()
+        # waits for the zygote to load the graph, so neither the request lock
+        # nor the query timeout covers the conversion
+        self._start()
+
+    def _start(self):
+        try:
+            self._zygote_conn.send(("fork",))
+            self._pid = self._zygote_conn.recv()
+            self._conn = Connection(recv_handle(self._zygote_conn))
+        except (EOFError, OSError):
+            self._pid = None
+            raise SparqlError("The query worker could not be started.")
+
+    def _stop(self):
+        if self._pid is not None:
+            try:
+                os.kill(self._pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            self._conn.close()
+        self._pid = None
+        self._conn = None
+
+    def _request(self, request: tuple, timeout: float | None):
+        with self._lock:
+            if self._pid is None:
+                self._start()
+
+            try:
+                self._conn.send(request)
+            except OSError:
+                # the worker exited since the last request, retry on a fresh one
+                self._stop()
+                self._start()
+                self._conn.send(request)
+
+            if not self._conn.poll(timeout):
+                self._stop()
+                raise SparqlTimeout(f"Query stopped after {timeout} seconds.")
+            try:
+                status, payload = self._conn.recv()
+            except EOFError:
+                self._stop()
+                raise SparqlError("The query worker exited unexpectedly.")
+
+        if status == "error":
+            raise SparqlError(payload)
+        return payload
+
+    def rows(self, query: str) -> Tuple[List, bool]:
+        """Rows of `query` and whether the result was cut at `max_rows`."""
+        return self._request(("query", query, self.max_rows), self.timeout)
+
+    def stats(self) -> Dict[str, int]:
+        return self._request(("stats",), None)
+
+    def invalidate(self):
+        """Drop the worker's cached results, call whenever the graph changes."""
+        self._request(("invalidate",), None)
+
+    def close(self):
+        with self._lock:
+            self._stop()
+            self._zygote_conn.close()
+            self._zygote.join()